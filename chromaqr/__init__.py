@@ -1,2 +1,38 @@
-from .encode import *
-from .decode import *
\ No newline at end of file
+import importlib
+
+# Public names and the modules they live in. Modules are only imported when one of their names is first used,
+# so encoding never loads pyzbar and the CLI can start without loading PIL, NumPy or qrcode at all.
+_EXPORTS = {
+    "Encoder": "encode",
+    "ErrorCorrection": "encode",
+    "BOX_SIZE": "encode",
+    "BORDER": "encode",
+    "MODES": "encode",
+    "Decoder": "decode",
+    "BatchResult": "decode",
+    "CodeResult": "decode",
+    "StreamEncoder": "stream",
+    "StreamDecoder": "stream",
+    "FRAME_HEADER": "stream",
+    "FRAME_MAGIC": "stream",
+    "VideoDecoder": "video",
+    "FrameResult": "video",
+    "max_payload": "capacity",
+    "plan": "capacity",
+    "Metrics": "metrics",
+    "DecodeStrategy": "strategy",
+    "Rung": "strategy"
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
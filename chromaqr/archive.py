@@ -0,0 +1,107 @@
+from base64 import b64decode, b64encode
+from io import RawIOBase
+from uuid import uuid4
+import json
+import os
+import zipfile
+
+# Largest number of payloads accepted in one batch, so one request cannot occupy a server for too long.
+MAX_BATCH_SIZE = 1000
+
+def read_jsonl(body: bytes) -> list:
+    """
+    Parse a batch of payloads sent as JSON lines into `(name, data)` pairs.
+    Each line is an object with the text to encode as `data`, or base64-encoded bytes if `encoding` is `base64`, and optionally a `name`.
+    Raises `ValueError` if a line is not valid.
+    """
+
+    items = []
+    for line in body.splitlines():
+        if line.strip() == b"":
+            continue
+
+        item = json.loads(line)
+        if not isinstance(item, dict) or not isinstance(item.get("data"), str):
+            raise ValueError("each line must be an object with a data string")
+
+        data = b64decode(item["data"], validate=True) if item.get("encoding") == "base64" else item["data"].encode("utf-8")
+        items.append((item.get("name"), data))
+
+    return items
+
+def result_fields(result: bytes) -> dict:
+    """
+    Describe a decoded payload for a JSON response, the opposite of `read_jsonl`.
+    Returns the payload as `result` if it is valid UTF-8, and otherwise base64-encoded with `encoding` set to `base64`.
+    """
+
+    try:
+        return {"result": result.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"result": b64encode(result).decode("ascii"), "encoding": "base64"}
+
+def entry_name(name: str, index: int, extension: str) -> str:
+    """Name an entry of an archive after the name given for a payload, or its position in the batch, without any directories."""
+
+    name = os.path.basename(str(name or index).replace("\\", "/")).replace('"', "") or str(index)
+    return name if name.endswith("." + extension) else "{}.{}".format(name, extension)
+
+class _Sink(RawIOBase):
+    """Unseekable file which keeps what is written to it until it is drained, so a zip file can be streamed as it is built."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class ZipWriter:
+    """
+    Builds a zip file one entry at a time, returning the bytes of each entry as it is added so the file can be streamed.
+    Entries are stored without compression, since encoded images are already compressed.
+    """
+
+    content_type = "application/zip"
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._archive = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_STORED)
+
+    def add(self, name: str, content_type: str, data: bytes) -> bytes:
+        self._archive.writestr(name, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Finish the file, returning the rest of its bytes, which hold the list of entries."""
+
+        self._archive.close()
+        return self._sink.drain()
+
+class MultipartWriter:
+    """Builds a `multipart/mixed` body one part at a time, like `ZipWriter`, with each name given as the file name of its part."""
+
+    def __init__(self, boundary: str = None):
+        self.boundary = boundary or uuid4().hex
+
+    @property
+    def content_type(self) -> str:
+        return "multipart/mixed; boundary={}".format(self.boundary)
+
+    def add(self, name: str, content_type: str, data: bytes) -> bytes:
+        header = "--{}\r\nContent-Type: {}\r\nContent-Disposition: attachment; filename=\"{}\"\r\n\r\n".format(self.boundary, content_type, name)
+        return header.encode("utf-8") + data + b"\r\n"
+
+    def close(self) -> bytes:
+        return "--{}--\r\n".format(self.boundary).encode("ascii")
+
+# Archive formats a batch of codes can be returned in.
+ARCHIVES = {"zip": ZipWriter, "multipart": MultipartWriter}
@@ -0,0 +1,482 @@
+from aiohttp import web, ClientSession, ClientTimeout, WSMsgType
+from concurrent.futures import ProcessPoolExecutor
+from .encode import Encoder, IMAGE_FORMATS, COMPRESS_LEVEL, parse_compress_level, to_bytes
+from .decode import _init_worker, _decode_source, _decode_all_source, _track_source
+from .cache import EncodeCache
+from .strategy import LADDER
+from .ingest import PayloadTooLarge, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, RAW_FRAME_HEADER, open_image
+from .archive import ARCHIVES, MAX_BATCH_SIZE, read_jsonl, entry_name, result_fields
+from collections import deque
+from qrcode.exceptions import DataOverflowError
+from io import BytesIO
+from base64 import b64encode, b64decode
+from urllib.parse import unquote_to_bytes
+import asyncio
+import os
+import json
+import jinja2
+
+absolute_directory = os.path.dirname(os.path.abspath(__file__))
+
+_PAGES = {"home": "/", "demo": "/demo", "realtime": "/realtime"}
+_templates = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(absolute_directory, "templates")), autoescape=True)
+_templates.globals["url_for"] = lambda endpoint: _PAGES[endpoint]
+
+# Cache of encoded PNGs, sized by the same `CHROMAQR_CACHE_BYTES` environment variable as the Flask server.
+encode_cache = EncodeCache(max_bytes=int(os.environ.get("CHROMAQR_CACHE_BYTES", 64 * 1024 * 1024)))
+
+class WorkerPool:
+    """
+    Process pool for encoding and decoding, with a bounded number of jobs in flight.
+    Once `workers + backlog` jobs are running or queued, the pool is `full` and new jobs should be rejected.
+    """
+
+    def __init__(self, workers = None, backlog = None):
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.limit = self.workers + (backlog if backlog is not None else self.workers * 2)
+        self.pending = 0
+        # Workers climb the retry ladder with a one second budget for each image, like the Flask server
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(False, True, LADDER, 1.0))
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.limit
+
+    async def run(self, function, *args):
+        """Run a function in a worker process without blocking the event loop."""
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+# Keys of the application state, typed where aiohttp supports it.
+_app_key = web.AppKey if hasattr(web, "AppKey") else lambda name, kind: name
+POOL = _app_key("pool", WorkerPool)
+SESSION = _app_key("session", ClientSession)
+MAX_FETCH_BYTES = _app_key("max_fetch_bytes", int)
+MAX_PIXELS = _app_key("max_pixels", int)
+
+def _encode_image(data: bytes, error_correction: str, image_format: str = "png", compress_level: int = COMPRESS_LEVEL) -> bytes:
+    """Encode data into a PNG or WebP file, for use in a worker process. Returns `None` if the data does not fit in a code."""
+
+    try:
+        # Palette images hold the same colours as RGB ones, and are several times faster to save as PNGs
+        image = Encoder(error_correction=error_correction, mode="P").encode(data)
+    except DataOverflowError:
+        return None
+    return to_bytes(image, image_format, compress_level)
+
+def _json(body: dict, status: int = 200, headers: dict = None) -> web.Response:
+    return web.Response(text=json.dumps(body), status=status, content_type="application/json", headers=headers)
+
+def _busy(method: str) -> web.Response:
+    return _json({
+        "method": method,
+        "success": False,
+        "error": "the server is busy, please try again later"
+    }, status=503, headers={"Retry-After": "1"})
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Check whether an `If-None-Match` header matches an entity tag."""
+
+    if header is None:
+        return False
+
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag).strip('"') == etag for tag in tags)
+
+async def _fetch(session: ClientSession, url: str, max_bytes: int) -> bytes:
+    """
+    Fetch the image at a URL, which can also be a `data:` URI, without blocking the event loop.
+    Raises `PayloadTooLarge` as soon as the image is known to be larger than `max_bytes`.
+    """
+
+    if url.startswith("data:"):
+        header, _, payload = url.partition(",")
+        if header.endswith(";base64"):
+            if len(payload) // 4 * 3 > max_bytes:
+                raise PayloadTooLarge()
+            data = b64decode(payload)
+        else:
+            data = unquote_to_bytes(payload)
+
+        if len(data) > max_bytes:
+            raise PayloadTooLarge()
+        return data
+
+    if not url.startswith(("http://", "https://")):
+        raise ValueError("unsupported URL scheme")
+
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise PayloadTooLarge()
+
+        data = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            data += chunk
+            if len(data) > max_bytes:
+                raise PayloadTooLarge()
+
+        return bytes(data)
+
+async def home(request):
+    return web.Response(text=_templates.get_template("home.html").render(), content_type="text/html")
+
+async def demo(request):
+    return web.Response(text=_templates.get_template("demo.html").render(), content_type="text/html")
+
+async def realtime(request):
+    return web.Response(text=_templates.get_template("realtime.html").render(), content_type="text/html")
+
+async def logo(request):
+    return web.FileResponse(os.path.join(absolute_directory, "..", "tests", "images", "generated.png"))
+
+async def encode(request):
+    """
+    Encoding endpoint for the API.
+    Takes one parameter, `data`, to encode.
+    Binary data can instead be sent as the raw body of an `application/octet-stream` request, with the other parameters in the query string.
+    """
+
+    raw = request.content_type == "application/octet-stream"
+    form = request.query if raw else await request.post()
+
+    if not raw and "data" not in form.keys():
+        return _json({
+            "method": "encode",
+            "success": False,
+            "error": "please specify the data parameter containing the string to encode"
+        }, status=400)
+
+    result_mode = form.get("format", "json")
+    error_correction = form.get("errorCorrection", "MED")
+
+    if error_correction not in ["LOW", "MED", "HIGH", "MAX"]:
+        return _json({
+            "method": "encode",
+            "success": False,
+            "error": "invalid error correction value, valid values are LOW, MED, HIGH and MAX"
+        }, status=400)
+
+    if result_mode not in ["json", "image", "png", "webp"]:
+        return _json({
+            "method": "encode",
+            "success": False,
+            "error": "unknown format, accepted formats are 'json', 'image', 'png' and 'webp'"
+        }, status=400)
+
+    try:
+        compress_level = parse_compress_level(form.get("compressLevel", COMPRESS_LEVEL))
+    except ValueError as e:
+        return _json({
+            "method": "encode",
+            "success": False,
+            "error": str(e)
+        }, status=400)
+
+    data = await request.read() if raw else form["data"].encode("utf-8")
+    image_format = "webp" if result_mode == "webp" else "png"
+    cache_key = EncodeCache.key(data, error_correction, "{}:{}".format(image_format, compress_level))
+    cached = encode_cache.get(cache_key)
+
+    if cached is None:
+        pool = request.app[POOL]
+        if pool.full:
+            return _busy("encode")
+
+        image_bytes = await pool.run(_encode_image, data, error_correction, image_format, compress_level)
+        if image_bytes is None:
+            return _json({
+                "method": "encode",
+                "success": False,
+                "error": "the data is too large to fit in a ChromaQR code"
+            }, status=400)
+        cached = encode_cache.put(cache_key, image_bytes)
+
+    etag = cached.etag if result_mode != "json" else cached.etag + "-json"
+    headers = {"ETag": '"{}"'.format(etag), "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    elif result_mode == "json":
+        return _json({
+            "method": "encode",
+            "success": True,
+            "error_correction": error_correction,
+            "result": "data:image/png;base64," + b64encode(cached.data).decode("utf-8")
+        }, headers=headers)
+    else:
+        return web.Response(body=cached.data, content_type=IMAGE_FORMATS[image_format], headers=headers)
+
+async def encode_batch(request):
+    """
+    Bulk encoding endpoint for the API.
+    Takes a batch of payloads as JSON lines, or as a multipart form with a file called `data` for each payload,
+    and streams back the codes in the same order as a zip file or a `multipart/mixed` body, one entry at a time.
+    The payloads are encoded in parallel in the worker processes, with at most one in flight for each worker.
+    """
+
+    params = dict(request.query)
+    try:
+        if request.content_type == "multipart/form-data":
+            form = await request.post()
+            params.update({key: value for key, value in form.items() if isinstance(value, str)})
+            items = [(field.filename, field.file.read()) for field in form.getall("data", []) if isinstance(field, web.FileField)]
+        else:
+            items = read_jsonl(await request.read())
+    except ValueError:
+        items = []
+
+    error_correction = params.get("errorCorrection", "MED")
+    image_format = params.get("format", "png")
+    archive = params.get("archive", "zip")
+
+    if error_correction not in ["LOW", "MED", "HIGH", "MAX"]:
+        error = "invalid error correction value, valid values are LOW, MED, HIGH and MAX"
+    elif image_format not in IMAGE_FORMATS:
+        error = "unknown format, accepted formats are 'png' and 'webp'"
+    elif archive not in ARCHIVES:
+        error = "unknown archive, accepted archives are 'zip' and 'multipart'"
+    elif len(items) == 0:
+        error = "no payloads were recognised in your request, either send JSON lines with a data field on each line or upload a file called 'data' for each payload"
+    else:
+        error = None
+
+    try:
+        compress_level = parse_compress_level(params.get("compressLevel", COMPRESS_LEVEL))
+    except ValueError as e:
+        error = error or str(e)
+
+    if error is not None:
+        return _json({"method": "encode", "success": False, "error": error}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return _json({
+            "method": "encode",
+            "success": False,
+            "error": "the batch is too large, the limit is {} payloads".format(MAX_BATCH_SIZE)
+        }, status=413)
+
+    pool = request.app[POOL]
+    if pool.full:
+        return _busy("encode")
+
+    writer = ARCHIVES[archive]()
+    response = web.StreamResponse(headers={"Content-Type": writer.content_type})
+    await response.prepare(request)
+
+    async def write(index, name, job):
+        image_bytes = await job
+        if image_bytes is None:
+            # The status has already been sent, so a payload which does not fit is reported in its own entry
+            await response.write(writer.add(entry_name(name, index, "error.txt"), "text/plain", b"the data is too large to fit in a ChromaQR code"))
+        else:
+            await response.write(writer.add(entry_name(name, index, image_format), IMAGE_FORMATS[image_format], image_bytes))
+
+    pending = deque()
+    try:
+        for index, (name, data) in enumerate(items):
+            pending.append((index, name, asyncio.ensure_future(pool.run(_encode_image, data, error_correction, image_format, compress_level))))
+            if len(pending) >= pool.workers:
+                await write(*pending.popleft())
+
+        while pending:
+            await write(*pending.popleft())
+    finally:
+        # Jobs which have not started yet are dropped if the client goes away
+        for _, _, job in pending:
+            job.cancel()
+
+    await response.write(writer.close())
+    await response.write_eof()
+    return response
+
+async def decode(request):
+    """
+    Decoding endpoint for the API.
+    Takes a file upload called `image` or a URL pointing to an image called `url`.
+    If `multiple` is `true`, every code in the image is decoded and returned in `results`.
+    The image is fetched asynchronously and decoded in a worker process.
+    """
+
+    pool = request.app[POOL]
+    if pool.full:
+        return _busy("decode")
+
+    try:
+        form = await request.post()
+        if "url" in form.keys():
+            image_bytes = await _fetch(request.app[SESSION], form["url"], request.app[MAX_FETCH_BYTES])
+        else:
+            image_bytes = form["image"].file.read()
+
+        # Decompression bombs are rejected from their header here, before a worker spends any memory on them
+        open_image(BytesIO(image_bytes), request.app[MAX_PIXELS]).close()
+    except (PayloadTooLarge, web.HTTPRequestEntityTooLarge):
+        return _json({
+            "method": "decode",
+            "success": False,
+            "error": "the image is too large, the limits are {} bytes and {} pixels".format(request.app[MAX_FETCH_BYTES], request.app[MAX_PIXELS])
+        }, status=413)
+    except Exception:
+        return _json({
+            "method": "decode",
+            "success": False,
+            "error": "no image file was recognised in your request, either upload a file with the identifier 'image' or submit a URL called 'url'"
+        }, status=400)
+
+    # The pool may have filled up while the image was being fetched
+    if pool.full:
+        return _busy("decode")
+
+    if form.get("multiple") == "true":
+        try:
+            codes = await pool.run(_decode_all_source, image_bytes)
+        except Exception:
+            return _json({
+                "method": "decode",
+                "success": False,
+                "error": "no image file was recognised in your request, either upload a file with the identifier 'image' or submit a URL called 'url'"
+            }, status=400)
+
+        if not codes:
+            return _json({
+                "method": "decode",
+                "success": False,
+                "error": "no ChromaQR code was found in the uploaded image"
+            }, status=404)
+
+        return _json({
+            "method": "decode",
+            "success": True,
+            "results": [dict(result_fields(code.result), coordinates=code.coordinates) for code in codes]
+        })
+
+    result = await pool.run(_decode_source, 0, image_bytes)
+
+    if result.error is not None:
+        return _json({
+            "method": "decode",
+            "success": False,
+            "error": "no image file was recognised in your request, either upload a file with the identifier 'image' or submit a URL called 'url'"
+        }, status=400)
+    elif result.result != b"":
+        response = {"method": "decode", "success": True}
+        response.update(result_fields(result.result))
+        response["coordinates"] = result.coordinates
+        return _json(response)
+    else:
+        return _json({
+            "method": "decode",
+            "success": False,
+            "error": "no ChromaQR code was found in the uploaded image"
+        }, status=404)
+
+async def stream(request):
+    """
+    Streaming endpoint for the realtime scanner.
+    Each binary WebSocket message is one frame, either an image file such as a JPEG or a raw frame with a `RAW_FRAME_HEADER`,
+    and each decoded frame is answered with a JSON text message.
+
+    Only one frame per connection is decoded at a time, and frames which arrive in the meantime replace each other,
+    so a client sending faster than frames can be decoded only ever waits for the newest one.
+    The position of the code is remembered between frames, so only the area around it is searched.
+    """
+
+    socket = web.WebSocketResponse(max_msg_size=request.app[MAX_FETCH_BYTES])
+    await socket.prepare(request)
+
+    pool = request.app[POOL]
+    latest = {"frame": None, "index": 0, "dropped": 0}
+    ready = asyncio.Event()
+
+    async def process():
+        code_quad = None
+
+        while True:
+            await ready.wait()
+            ready.clear()
+            frame, index, dropped = latest["frame"], latest["index"], latest["dropped"]
+            latest["frame"], latest["dropped"] = None, 0
+
+            if pool.full:
+                await socket.send_json({"method": "stream", "success": False, "frame": index, "dropped": dropped, "error": "the server is busy, please try again later"})
+                continue
+
+            try:
+                result = await pool.run(_track_source, frame, code_quad, request.app[MAX_PIXELS])
+            except Exception as e:
+                await socket.send_json({"method": "stream", "success": False, "frame": index, "dropped": dropped, "error": str(e)})
+                continue
+
+            code_quad = result.coordinates
+            response = {"method": "stream", "success": result.result != b"", "frame": index, "dropped": dropped}
+
+            if result.error is not None:
+                response["error"] = result.error
+            elif result.result != b"":
+                response.update(result_fields(result.result))
+                response["coordinates"] = result.coordinates
+            else:
+                response["error"] = "no ChromaQR code was found in the frame"
+
+            await socket.send_json(response)
+
+    processor = asyncio.ensure_future(process())
+
+    try:
+        async for message in socket:
+            if message.type == WSMsgType.BINARY:
+                if latest["frame"] is not None:
+                    latest["dropped"] += 1
+                latest["frame"] = message.data
+                latest["index"] += 1
+                ready.set()
+    finally:
+        processor.cancel()
+
+    return socket
+
+def create_app(workers = None, backlog = None, fetch_timeout = 10.0, max_fetch_bytes = MAX_IMAGE_BYTES, max_pixels = MAX_IMAGE_PIXELS) -> web.Application:
+    """
+    Create the asynchronous API server.
+
+    Encoding and decoding run in a pool of `workers` processes, defaulting to the number of CPUs,
+    with up to `backlog` further jobs queued before requests are rejected with 503 responses.
+    URLs are fetched with a total timeout of `fetch_timeout` seconds, and images larger than `max_fetch_bytes`
+    or with more than `max_pixels` pixels are rejected.
+    """
+
+    app = web.Application(client_max_size=max_fetch_bytes + 64 * 1024)
+    app[MAX_FETCH_BYTES] = max_fetch_bytes
+    app[MAX_PIXELS] = max_pixels
+
+    async def start(app):
+        app[POOL] = WorkerPool(workers, backlog)
+        app[SESSION] = ClientSession(timeout=ClientTimeout(total=fetch_timeout))
+
+    async def stop(app):
+        await app[SESSION].close()
+        app[POOL].shutdown()
+
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+
+    app.router.add_get("/", home)
+    app.router.add_get("/demo", demo)
+    app.router.add_get("/realtime", realtime)
+    app.router.add_get("/logo.png", logo)
+    app.router.add_post("/encode", encode)
+    app.router.add_post("/encode-batch", encode_batch)
+    app.router.add_post("/decode", decode)
+    app.router.add_get("/stream", stream)
+
+    return app
+
+def run(host="0.0.0.0", port=8000, workers=None):
+    web.run_app(create_app(workers=workers), host=host, port=port)
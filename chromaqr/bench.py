@@ -0,0 +1,189 @@
+from PIL import Image
+from .encode import Encoder
+from .decode import Decoder
+from .capacity import max_payload
+from io import BytesIO
+from time import perf_counter
+import numpy as np
+import datetime
+import platform
+import random
+import sys
+
+# Payload sizes in bytes, where `None` is the largest payload which fits at each error correction level.
+PAYLOAD_SIZES = [16, 256, 2048, None]
+ERROR_CORRECTION_LEVELS = ["LOW", "MED", "HIGH", "MAX"]
+VARIANTS = ["clean", "noisy", "rotated", "jpeg"]
+# Widths in pixels which the images are resized to before decoding, where `None` keeps the generated size.
+RESOLUTIONS = [None, 800, 3000]
+
+def _payload(size: int) -> bytes:
+    """Build a repeatable payload of lowercase letters, so it is always encoded in byte mode."""
+
+    return bytes(random.Random(size).choices(b"abcdefghijklmnopqrstuvwxyz", k=size))
+
+def _variant(image: Image, variant: str, resolution: int):
+    """
+    Simulate a photo of a generated code by resizing it, then adding noise, rotating or compressing it.
+    JPEGs are returned as the bytes of the file, so that each decode opens and loads the file like an upload would.
+    """
+
+    image = image.convert("RGB")
+
+    if resolution is not None:
+        image = image.resize((resolution, image.size[1] * resolution // image.size[0]), Image.BILINEAR)
+
+    if variant == "noisy":
+        pixels = np.asarray(image).astype(np.int16) + np.random.RandomState(0).normal(0, 24, (image.size[1], image.size[0], 3)).astype(np.int16)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    elif variant == "rotated":
+        image = image.rotate(10, resample=Image.BILINEAR, expand=True, fillcolor=(255, 255, 255))
+    elif variant == "jpeg":
+        output_data = BytesIO()
+        image.save(output_data, "jpeg", quality=70)
+        return output_data.getvalue()
+
+    return image
+
+def _peak_rss() -> float:
+    """Return the peak resident set size of the process in megabytes, or `None` where it is not available."""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+class _StageRecorder:
+    """Add up the stage timings reported by an `Encoder` or `Decoder`, ignoring their other measurements."""
+
+    def __init__(self):
+        self.totals = {}
+
+    def timing(self, stage: str, seconds: float):
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def reset(self) -> dict:
+        totals, self.totals = self.totals, {}
+        return totals
+
+def _summarise(case: dict, times: list, stages: list, payload_size: int) -> dict:
+    times_ms = np.array(times) * 1000
+    case.update({
+        "p50_ms": round(float(np.percentile(times_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(times_ms, 99)), 3),
+        "mean_ms": round(float(times_ms.mean()), 3),
+        "throughput_per_s": round(1000 / float(times_ms.mean()), 2),
+        "bytes_per_s": round(payload_size * 1000 / float(times_ms.mean()), 1),
+        "stages_ms": {stage: round(float(np.median([s.get(stage, 0.0) for s in stages])) * 1000, 3) for stage in sorted(set().union(*stages))},
+        "peak_rss_mb": _peak_rss()
+    })
+    return case
+
+def run(sizes: list = None, levels: list = None, variants: list = None, resolutions: list = None, repeat: int = 5, progress = None) -> dict:
+    """
+    Time encoding and decoding across payload sizes, error correction levels, image variants and resolutions.
+    Returns a JSON-serialisable report, with one result for each case. `progress` is called with each result as it finishes.
+
+    Each result has the median and 99th percentile latency, throughput, the peak RSS of the process so far,
+    and the median time spent in each stage reported through the `metrics` hook of the encoder and decoder.
+    """
+
+    sizes = PAYLOAD_SIZES if sizes is None else sizes
+    levels = ERROR_CORRECTION_LEVELS if levels is None else levels
+    variants = VARIANTS if variants is None else variants
+    resolutions = RESOLUTIONS if resolutions is None else resolutions
+
+    results = []
+    def record(result):
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    for level in levels:
+        recorder = _StageRecorder()
+        encoder = Encoder(error_correction=level, metrics=recorder)
+        decoder = Decoder(metrics=recorder)
+        capacity = max_payload(level)
+
+        for size in sizes:
+            size = capacity if size is None else size
+            if size > capacity:
+                continue
+            data = _payload(size)
+
+            times, stages = [], []
+            for _ in range(repeat):
+                start = perf_counter()
+                image = encoder.encode(data)
+                times.append(perf_counter() - start)
+                stages.append(recorder.reset())
+
+            record(_summarise({"operation": "encode", "error_correction": level, "payload_bytes": size}, times, stages, size))
+
+            for variant in variants:
+                for resolution in resolutions:
+                    source = _variant(image, variant, resolution)
+                    dimensions = Image.open(BytesIO(source)).size if isinstance(source, bytes) else source.size
+                    times, stages, successes = [], [], 0
+
+                    for _ in range(repeat):
+                        # Opening a file is lazy, so it is timed, but copying an image in memory is not
+                        if isinstance(source, bytes):
+                            start = perf_counter()
+                            frame = Image.open(BytesIO(source))
+                        else:
+                            frame = source.copy()
+                            start = perf_counter()
+
+                        successes += decoder.decode(frame) == data
+                        times.append(perf_counter() - start)
+                        stages.append(recorder.reset())
+
+                    record(_summarise({
+                        "operation": "decode",
+                        "error_correction": level,
+                        "payload_bytes": size,
+                        "variant": variant,
+                        "resolution": list(dimensions),
+                        "success_rate": successes / repeat
+                    }, times, stages, size))
+
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "peak_rss_mb": _peak_rss(),
+        "results": results
+    }
+
+def _case_key(result: dict) -> tuple:
+    return (result["operation"], result["error_correction"], result["payload_bytes"], result.get("variant"), tuple(result.get("resolution") or ()))
+
+def compare(baseline: dict, report: dict, tolerance: float = 0.1) -> list:
+    """
+    Compare a report against a baseline report from an earlier run.
+    Returns `(baseline result, new result)` pairs for every case whose median latency got worse by more than `tolerance`,
+    or whose decoding success rate dropped.
+    """
+
+    previous = {_case_key(result): result for result in baseline["results"]}
+    regressions = []
+
+    for result in report["results"]:
+        old = previous.get(_case_key(result))
+        if old is None:
+            continue
+        if result["p50_ms"] > old["p50_ms"] * (1 + tolerance) or result.get("success_rate", 1) < old.get("success_rate", 1):
+            regressions.append((old, result))
+
+    return regressions
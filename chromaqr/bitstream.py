@@ -0,0 +1,453 @@
+import numpy as np
+from functools import lru_cache
+
+# Number of error correction codewords in each block, indexed by error correction level then version.
+_EC_CODEWORDS_PER_BLOCK = {
+    "L": (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "M": (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    "Q": (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "H": (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30)
+}
+
+# Number of error correction blocks, indexed by error correction level then version.
+_EC_BLOCKS = {
+    "L": (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    "M": (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    "Q": (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    "H": (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81)
+}
+
+# Error correction level for each value of the two level bits in the format information.
+_FORMAT_LEVELS = ("M", "L", "H", "Q")
+
+# Character count indicator lengths for numeric, alphanumeric, byte and kanji modes.
+_COUNT_BITS = {
+    0b0001: (10, 12, 14),
+    0b0010: (9, 11, 13),
+    0b0100: (8, 16, 16),
+    0b1000: (8, 10, 12)
+}
+
+_ALPHANUMERIC = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+# Arithmetic tables for GF(256) with the QR code primitive polynomial x^8 + x^4 + x^3 + x^2 + 1.
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11d
+for _power in range(255, 512):
+    _EXP[_power] = _EXP[_power - 255]
+
+_EXP_ARRAY = np.array(_EXP, dtype=np.int32)
+_LOG_ARRAY = np.array(_LOG, dtype=np.int32)
+
+def _mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def _div(a: int, b: int) -> int:
+    if a == 0:
+        return 0
+    return _EXP[(_LOG[a] - _LOG[b]) % 255]
+
+def _evaluate(poly: list, x: int) -> int:
+    """Evaluate a polynomial stored lowest degree first at `x`."""
+
+    result = 0
+    for coefficient in reversed(poly):
+        result = _mul(result, x) ^ coefficient
+    return result
+
+def _format_codewords() -> dict:
+    """Build a map from every valid 15-bit format information codeword to its (level, mask) pair."""
+
+    codewords = {}
+    for level_bits in range(4):
+        for mask in range(8):
+            data = (level_bits << 3) | mask
+            remainder = data
+            for _ in range(10):
+                remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+            codewords[((data << 10) | remainder) ^ 0x5412] = (_FORMAT_LEVELS[level_bits], mask)
+    return codewords
+
+_FORMAT_CODEWORDS = _format_codewords()
+
+def format_bits(level: str, mask: int) -> int:
+    """Return the 15-bit format information codeword for an error correction level and mask pattern."""
+
+    for codeword, format_info in _FORMAT_CODEWORDS.items():
+        if format_info == (level, mask):
+            return codeword
+
+def alignment_positions(version: int) -> list:
+    """Return the row and column coordinates of the alignment pattern centres for a version."""
+
+    if version == 1:
+        return []
+
+    count = version // 7 + 2
+    size = version * 4 + 17
+    step = 26 if version == 32 else (version * 4 + count * 2 + 1) // (count * 2 - 2) * 2
+    return [6] + [size - 7 - i * step for i in reversed(range(count - 1))]
+
+def raw_codewords(version: int) -> int:
+    """Return the number of codewords (data and error correction) a version can hold."""
+
+    modules = (16 * version + 128) * version + 64
+    if version >= 2:
+        count = version // 7 + 2
+        modules -= (25 * count - 10) * count - 55
+        if version >= 7:
+            modules -= 36
+    return modules // 8
+
+def block_structure(version: int, level: str) -> tuple:
+    """
+    Return how the codewords of a version and error correction level are split into blocks, as
+    `(block_count, ec_count, short_count, short_length)`. The first `short_count` blocks hold `short_length`
+    codewords and the rest hold one more, with the last `ec_count` codewords of each block being error correction.
+    """
+
+    total = raw_codewords(version)
+    block_count = _EC_BLOCKS[level][version]
+    return block_count, _EC_CODEWORDS_PER_BLOCK[level][version], block_count - total % block_count, total // block_count
+
+@lru_cache(maxsize=None)
+def function_pattern_mask(version: int) -> np.ndarray:
+    """
+    Return a boolean matrix which is `True` for every module reserved for function patterns,
+    format information and version information.
+    """
+
+    size = version * 4 + 17
+    mask = np.zeros((size, size), dtype=bool)
+
+    # Finder patterns and their separators, plus the format information next to them
+    mask[:9, :9] = True
+    mask[:9, size - 8:] = True
+    mask[size - 8:, :9] = True
+
+    # Timing patterns
+    mask[6, :] = True
+    mask[:, 6] = True
+
+    positions = alignment_positions(version)
+    for row in positions:
+        for col in positions:
+            if (row == 6 and col == 6) or (row == 6 and col == size - 7) or (row == size - 7 and col == 6):
+                continue
+            mask[row - 2 : row + 3, col - 2 : col + 3] = True
+
+    if version >= 7:
+        mask[:6, size - 11 : size - 8] = True
+        mask[size - 11 : size - 8, :6] = True
+
+    mask.flags.writeable = False
+    return mask
+
+@lru_cache(maxsize=None)
+def codeword_order(version: int) -> tuple:
+    """Return the row and column of every data module in the order its bit appears in the codewords."""
+
+    size = version * 4 + 17
+    reserved = function_pattern_mask(version)
+    rows, cols = [], []
+
+    right = size - 1
+    while right >= 1:
+        if right == 6:
+            right = 5
+        upward = ((right + 1) & 2) == 0
+        for vertical in range(size):
+            row = size - 1 - vertical if upward else vertical
+            for col in (right, right - 1):
+                if not reserved[row, col]:
+                    rows.append(row)
+                    cols.append(col)
+        right -= 2
+
+    return np.array(rows), np.array(cols)
+
+@lru_cache(maxsize=None)
+def mask_pattern(version: int, mask: int) -> np.ndarray:
+    """Return a boolean matrix which is `True` for every module flipped by the given mask pattern."""
+
+    size = version * 4 + 17
+    y, x = np.indices((size, size))
+    patterns = (
+        lambda: (x + y) % 2 == 0,
+        lambda: y % 2 == 0,
+        lambda: x % 3 == 0,
+        lambda: (x + y) % 3 == 0,
+        lambda: (x // 3 + y // 2) % 2 == 0,
+        lambda: x * y % 2 + x * y % 3 == 0,
+        lambda: (x * y % 2 + x * y % 3) % 2 == 0,
+        lambda: ((x + y) % 2 + x * y % 3) % 2 == 0
+    )
+    pattern = patterns[mask]()
+    pattern.flags.writeable = False
+    return pattern
+
+@lru_cache(maxsize=None)
+def format_positions(size: int) -> tuple:
+    """
+    Return the rows and columns of the two copies of the format information, in bit order.
+    The first copy surrounds the top left finder pattern and the second is split between the other two.
+    """
+
+    first = [(i, 8) for i in range(6)] + [(7, 8), (8, 8), (8, 7)] + [(8, 14 - i) for i in range(9, 15)]
+    second = [(8, size - 1 - i) for i in range(8)] + [(size - 15 + i, 8) for i in range(8, 15)]
+    return tuple((np.array([row for row, _ in copy]), np.array([col for _, col in copy])) for copy in (first, second))
+
+def _format_value(modules: np.ndarray, positions: tuple) -> int:
+    rows, cols = positions
+    return sum(int(bit) << i for i, bit in enumerate(modules[rows, cols]))
+
+def read_format(modules: np.ndarray) -> tuple:
+    """
+    Read the format information from a module matrix.
+    Returns the error correction level (`"L"`, `"M"`, `"Q"` or `"H"`) and the mask pattern.
+    Raises `ValueError` if neither copy of the format information is readable.
+    """
+
+    best, best_distance = None, 4
+    for positions in format_positions(modules.shape[0]):
+        value = _format_value(modules, positions)
+        for codeword, format_info in _FORMAT_CODEWORDS.items():
+            distance = bin(value ^ codeword).count("1")
+            if distance < best_distance:
+                best, best_distance = format_info, distance
+
+    if best is None:
+        raise ValueError("format information could not be read")
+
+    return best
+
+def format_distance(modules: np.ndarray) -> int:
+    """Return the Hamming distance between the first copy of the format information and the nearest valid codeword."""
+
+    value = _format_value(modules, format_positions(modules.shape[0])[0])
+    return min(bin(value ^ codeword).count("1") for codeword in _FORMAT_CODEWORDS)
+
+def _syndromes(blocks: list, ec_count: int) -> np.ndarray:
+    """
+    Compute the Reed-Solomon syndromes of every block at once.
+    Returns an array with one row of `ec_count` syndromes per block.
+    """
+
+    length = max(len(block) for block in blocks)
+    # Short blocks are padded at the front, which leaves their polynomial unchanged
+    codewords = np.zeros((len(blocks), length), dtype=np.int32)
+    for i, block in enumerate(blocks):
+        codewords[i, length - len(block):] = block
+
+    powers = np.arange(ec_count, dtype=np.int32)
+    values = np.zeros((len(blocks), ec_count), dtype=np.int32)
+    for k in range(length):
+        values = np.where(values != 0, _EXP_ARRAY[_LOG_ARRAY[values] + powers], 0) ^ codewords[:, k : k + 1]
+
+    return values
+
+@lru_cache(maxsize=None)
+def _generator(ec_count: int) -> tuple:
+    """Return the coefficients of the Reed-Solomon generator polynomial, highest degree first, excluding the leading one."""
+
+    poly = [1]
+    for i in range(ec_count):
+        # Multiply by (x - a^i), which is (x + a^i) in GF(256)
+        poly = [a ^ _mul(b, _EXP[i]) for a, b in zip(poly + [0], [0] + poly)]
+    return tuple(poly[1:])
+
+def error_correction_codewords(blocks: np.ndarray, ec_count: int) -> np.ndarray:
+    """
+    Compute the Reed-Solomon error correction codewords for a `(block_count, data_length)` array of data codewords.
+    Blocks with fewer data codewords should be padded with zeros at the front.
+    Returns a `(block_count, ec_count)` array.
+    """
+
+    generator_log = _LOG_ARRAY[np.array(_generator(ec_count), dtype=np.int32)]
+
+    remainder = np.zeros((blocks.shape[0], ec_count), dtype=np.int32)
+    for k in range(blocks.shape[1]):
+        factor = blocks[:, k].astype(np.int32) ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        remainder ^= np.where(factor[:, None] != 0, _EXP_ARRAY[_LOG_ARRAY[factor][:, None] + generator_log[None, :]], 0)
+
+    return remainder
+
+def correct_block(block: list, ec_count: int, syndromes: list = None) -> list:
+    """
+    Correct errors in a single Reed-Solomon block in place and return it.
+    Raises `ValueError` if the block has more errors than can be corrected.
+    """
+
+    length = len(block)
+    if syndromes is None:
+        syndromes = _syndromes([block], ec_count)[0].tolist()
+
+    if not any(syndromes):
+        return block
+
+    # Berlekamp-Massey, finding the error locator polynomial
+    locator, previous = [1], [1]
+    errors, shift, last_discrepancy = 0, 1, 1
+    for n in range(ec_count):
+        discrepancy = syndromes[n]
+        for i in range(1, errors + 1):
+            if i < len(locator):
+                discrepancy ^= _mul(locator[i], syndromes[n - i])
+
+        if discrepancy == 0:
+            shift += 1
+            continue
+
+        coefficient = _div(discrepancy, last_discrepancy)
+        updated = locator + [0] * max(0, len(previous) + shift - len(locator))
+        for i, value in enumerate(previous):
+            updated[i + shift] ^= _mul(coefficient, value)
+
+        if 2 * errors <= n:
+            previous, last_discrepancy = locator, discrepancy
+            errors = n + 1 - errors
+            shift = 1
+        else:
+            shift += 1
+        locator = updated
+
+    if errors * 2 > ec_count:
+        raise ValueError("too many errors to correct")
+
+    # Chien search, finding the positions where the locator polynomial has roots
+    positions = []
+    for index in range(length):
+        power = length - 1 - index
+        if _evaluate(locator, _EXP[(255 - power) % 255]) == 0:
+            positions.append(index)
+
+    if len(positions) != errors:
+        raise ValueError("too many errors to correct")
+
+    # Forney algorithm, finding the value of each error
+    evaluator = [0] * ec_count
+    for i, syndrome in enumerate(syndromes):
+        for j, value in enumerate(locator):
+            if i + j < ec_count:
+                evaluator[i + j] ^= _mul(syndrome, value)
+    derivative = [locator[i] if i % 2 == 1 else 0 for i in range(1, len(locator))]
+
+    for index in positions:
+        x = _EXP[length - 1 - index]
+        x_inverse = _EXP[(255 - (length - 1 - index)) % 255]
+        denominator = _evaluate(derivative, x_inverse)
+        if denominator == 0:
+            raise ValueError("too many errors to correct")
+        block[index] ^= _mul(x, _div(_evaluate(evaluator, x_inverse), denominator))
+
+    if _syndromes([block], ec_count).any():
+        raise ValueError("too many errors to correct")
+
+    return block
+
+def _parse_segments(data: bytes, version: int) -> bytes:
+    """Parse the mode segments of the corrected data codewords into the payload bytes."""
+
+    bits = "".join(format(byte, "08b") for byte in data)
+    position = 0
+    size_class = 0 if version <= 9 else 1 if version <= 26 else 2
+    result = bytearray()
+
+    def read(count):
+        nonlocal position
+        if position + count > len(bits):
+            raise ValueError("segment runs past the end of the data")
+        position += count
+        return int(bits[position - count : position], 2)
+
+    while len(bits) - position >= 4:
+        mode = read(4)
+
+        if mode == 0b0000:
+            break
+        elif mode == 0b0111:
+            # Extended channel interpretation, the payload bytes are passed through untouched
+            designator = read(8)
+            if designator & 0x80:
+                read(8 if designator & 0x40 == 0 else 16)
+            continue
+        elif mode not in _COUNT_BITS or mode == 0b1000:
+            raise ValueError("unsupported segment mode {}".format(mode))
+
+        count = read(_COUNT_BITS[mode][size_class])
+
+        if mode == 0b0001:
+            while count >= 3:
+                result += "{:03d}".format(read(10)).encode("ascii")
+                count -= 3
+            if count == 2:
+                result += "{:02d}".format(read(7)).encode("ascii")
+            elif count == 1:
+                result += "{:01d}".format(read(4)).encode("ascii")
+        elif mode == 0b0010:
+            while count >= 2:
+                value = read(11)
+                if value >= 45 * 45:
+                    raise ValueError("invalid alphanumeric value")
+                result += bytes((_ALPHANUMERIC[value // 45], _ALPHANUMERIC[value % 45]))
+                count -= 2
+            if count == 1:
+                value = read(6)
+                if value >= 45:
+                    raise ValueError("invalid alphanumeric value")
+                result += bytes((_ALPHANUMERIC[value],))
+        elif count > 0:
+            result += read(count * 8).to_bytes(count, "big")
+
+    return bytes(result)
+
+def decode_modules(modules: np.ndarray) -> bytes:
+    """
+    Decode a square boolean matrix of QR code modules, where `True` is dark, into its payload.
+    Raises `ValueError` if the matrix cannot be decoded.
+    """
+
+    size = modules.shape[0]
+    version = (size - 17) // 4
+    if size != version * 4 + 17 or not 1 <= version <= 40:
+        raise ValueError("invalid module matrix size {}".format(size))
+
+    level, mask = read_format(modules)
+    rows, cols = codeword_order(version)
+    total = raw_codewords(version)
+    bits = modules[rows, cols] ^ mask_pattern(version, mask)[rows, cols]
+    codewords = np.packbits(bits[: total * 8]).tolist()
+
+    block_count, ec_count, short_count, short_length = block_structure(version, level)
+    short_data = short_length - ec_count
+
+    # Undo the interleaving of the codewords, with short blocks having one fewer data codeword
+    blocks = [[] for _ in range(block_count)]
+    index = 0
+    for i in range(short_length + 1):
+        for j in range(block_count):
+            if i == short_data and j < short_count:
+                continue
+            blocks[j].append(codewords[index])
+            index += 1
+
+    # Most blocks have no errors, so only blocks with a non-zero syndrome go through correction
+    syndromes = _syndromes(blocks, ec_count)
+    data = bytearray()
+    for block, block_syndromes in zip(blocks, syndromes.tolist()):
+        if any(block_syndromes):
+            block = correct_block(block, ec_count, block_syndromes)
+        data += bytes(block[: len(block) - ec_count])
+
+    return _parse_segments(bytes(data), version)
@@ -0,0 +1,67 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import hashlib
+
+# A cached image and the entity tag identifying its content.
+CacheEntry = namedtuple("CacheEntry", "data etag")
+
+class EncodeCache:
+    """
+    Thread-safe least recently used cache of encoded images.
+    Bounded by the total size of the cached images in bytes, and counts hits and misses.
+    """
+
+    def __init__(self, max_bytes = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(data: bytes, error_correction: str, image_format: str) -> tuple:
+        """Build a content-addressed cache key, so large payloads are not kept in memory as keys."""
+
+        return (hashlib.sha256(data).digest(), error_correction, image_format)
+
+    def get(self, key: tuple) -> CacheEntry:
+        """Return the cached entry for a key and mark it as recently used, or `None` if it is not cached."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, data: bytes) -> CacheEntry:
+        """
+        Cache an encoded image, evicting the least recently used images if the cache is full.
+        Returns the new entry, which is not stored if the image alone is larger than the cache.
+        """
+
+        entry = CacheEntry(data, hashlib.sha256(data).hexdigest()[:32])
+
+        if len(data) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key).data)
+
+            self._entries[key] = entry
+            self.size += len(data)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.data)
+
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
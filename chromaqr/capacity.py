@@ -0,0 +1,179 @@
+from qrcode import constants, exceptions, util
+from collections import namedtuple
+import re
+
+# Error correction levels by name, as the `qrcode` constant and the letter used for block structures.
+LEVELS = {
+    "LOW": (constants.ERROR_CORRECT_L, "L"),
+    "MED": (constants.ERROR_CORRECT_M, "M"),
+    "HIGH": (constants.ERROR_CORRECT_Q, "Q"),
+    "MAX": (constants.ERROR_CORRECT_H, "H")
+}
+
+# Number of data bits in a single code of each version, for each error correction level, indexed by version.
+CAPACITY_BITS = {name: tuple(util.BIT_LIMIT_TABLE[constant]) for name, (constant, _) in LEVELS.items()}
+
+# Segment modes in order of how compactly they store a character, with the cost of one character in sixths of a bit.
+_MODES = (util.MODE_NUMBER, util.MODE_ALPHA_NUM, util.MODE_8BIT_BYTE)
+_CHARACTER_COST = (20, 33, 48)
+_NUMERIC = frozenset(b"0123456789")
+_ALPHANUMERIC = frozenset(util.ALPHA_NUM)
+
+# Runs of alphanumeric characters shorter than this are never worth a segment of their own inside byte mode data,
+# because the extra mode and count indicators cost more than the bits they save.
+_WORTHWHILE_RUN = re.compile(b"[" + re.escape(util.ALPHA_NUM) + b"]{4,}")
+
+# How the payload of one ChromaQR code is laid out: the version shared by all three codes,
+# and the `QRData` segments of the red, green and blue codes, whose data joins up to the payload in that order.
+Plan = namedtuple("Plan", "version parts")
+
+def _segment_bits(mode: int, length: int, version: int) -> int:
+    """Return the number of bits taken by a segment, including its mode and count indicators."""
+
+    if mode == util.MODE_NUMBER:
+        payload = 10 * (length // 3) + (0, 4, 7)[length % 3]
+    elif mode == util.MODE_ALPHA_NUM:
+        payload = 11 * (length // 2) + 6 * (length % 2)
+    else:
+        payload = 8 * length
+    return 4 + util.length_in_bits(mode, version) + payload
+
+def _fit(data: bytes, start: int, version: int, capacity: int) -> tuple:
+    """
+    Find the longest run of `data` from `start` which fits in `capacity` bits at a version,
+    with each character in the most compact mode once the cost of switching modes is taken into account.
+    Returns the end of the run and its segments.
+    """
+
+    if _WORTHWHILE_RUN.search(data, start) is None:
+        # Without a long enough alphanumeric run, a single segment in the most compact mode for all of it is optimal
+        length = max(0, min(len(data) - start, (capacity - 4 - util.length_in_bits(util.MODE_8BIT_BYTE, version)) // 8))
+        segment = util.QRData(data[start : start + length])
+        if _segment_bits(segment.mode, length, version) > capacity:
+            return start, []
+        return start + length, [segment]
+
+    # Dynamic programming over the characters, keeping the cheapest way to end in each mode, in sixths of a bit.
+    # Switching modes rounds the previous segment up to whole bits, so the costs are exact.
+    # The loop is unrolled over the three modes because it runs once for every character.
+    numeric_header, alphanumeric_header, byte_header = [(4 + util.length_in_bits(mode, version)) * 6 for mode in _MODES]
+    numeric_cost, alphanumeric_cost, byte_cost = _CHARACTER_COST
+    limit = capacity * 6
+    infinity = float("inf")
+    history = []
+    end, end_mode = start, None
+
+    character = data[start] if start < len(data) else None
+    numeric = numeric_header + numeric_cost if character in _NUMERIC else infinity
+    alphanumeric = alphanumeric_header + alphanumeric_cost if character in _ALPHANUMERIC else infinity
+    byte = byte_header + byte_cost
+
+    for position in range(start, len(data)):
+        if position > start:
+            character = data[position]
+
+            # Cheapest mode to switch from, rounded up to whole bits
+            switch, cheapest = (0, numeric) if numeric <= alphanumeric and numeric <= byte else (1, alphanumeric) if alphanumeric <= byte else (2, byte)
+            cheapest = (cheapest + 5) // 6 * 6
+
+            if byte <= cheapest + byte_header:
+                byte, byte_source = byte + byte_cost, 2
+            else:
+                byte, byte_source = cheapest + byte_header + byte_cost, switch
+
+            if character not in _ALPHANUMERIC:
+                alphanumeric, alphanumeric_source = infinity, None
+            elif alphanumeric <= cheapest + alphanumeric_header:
+                alphanumeric, alphanumeric_source = alphanumeric + alphanumeric_cost, 1
+            else:
+                alphanumeric, alphanumeric_source = cheapest + alphanumeric_header + alphanumeric_cost, switch
+
+            if character not in _NUMERIC:
+                numeric, numeric_source = infinity, None
+            elif numeric <= cheapest + numeric_header:
+                numeric, numeric_source = numeric + numeric_cost, 0
+            else:
+                numeric, numeric_source = cheapest + numeric_header + numeric_cost, switch
+
+            history.append((numeric_source, alphanumeric_source, byte_source))
+        else:
+            history.append((None, None, None))
+
+        # The cheapest cost never goes down as the run gets longer, so the first run which does not fit ends the search
+        best, cheapest = (0, numeric) if numeric <= alphanumeric and numeric <= byte else (1, alphanumeric) if alphanumeric <= byte else (2, byte)
+        if (cheapest + 5) // 6 * 6 > limit:
+            break
+        end, end_mode = position + 1, best
+
+    # Walk back through the choices to recover the segments
+    segments = []
+    mode, segment_end = end_mode, end
+    for position in range(end - 1, start - 1, -1):
+        source = history[position - start][mode]
+        if source != mode:
+            segments.append(util.QRData(data[position : segment_end], mode=_MODES[mode], check_data=False))
+            mode, segment_end = source, position
+
+    return end, segments[::-1]
+
+def plan(data: bytes, error_correction: str = "MED") -> Plan:
+    """
+    Choose the smallest version which all three codes can share for a payload, and how to split it between them.
+    Each part is split into numeric, alphanumeric and byte mode segments to take as few bits as possible.
+    Equal thirds are used whenever they fit, and otherwise the red and green codes are filled first.
+    Raises `DataOverflowError` if the payload does not fit in a ChromaQR code.
+    """
+
+    data = bytes(data)
+    capacities = CAPACITY_BITS[error_correction]
+    third = -(-len(data) // 3)
+    thirds = [data[0 : third], data[third : third * 2], data[third * 2 :]]
+
+    # Splitting a payload never makes it smaller, so the cost of the whole payload as one part, which only depends on
+    # the size class of the version, rules out versions without enough room in the three codes together
+    minimum_bits = {}
+
+    for version in range(1, 41):
+        capacity = capacities[version]
+        size_class = 9 if version < 10 else 26 if version < 27 else 40
+        if size_class not in minimum_bits:
+            # Any payload fits in one byte mode segment of this many bits
+            _, segments = _fit(data, 0, size_class, 8 * len(data) + 24)
+            minimum_bits[size_class] = sum(_segment_bits(segment.mode, len(segment.data), size_class) for segment in segments)
+        if minimum_bits[size_class] > capacity * 3:
+            continue
+
+        fits = [_fit(part, 0, version, capacity) for part in thirds]
+        if all(end == len(part) for part, (end, _) in zip(thirds, fits)):
+            return Plan(version, [segments for _, segments in fits])
+
+        parts, start = [], 0
+        for _ in range(3):
+            start, segments = _fit(data, start, version, capacity)
+            parts.append(segments)
+        if start == len(data):
+            return Plan(version, parts)
+
+    raise exceptions.DataOverflowError()
+
+def max_payload(error_correction: str = "MED", mode: str = "byte") -> int:
+    """
+    Return the largest payload which fits in a single ChromaQR code at an error correction level.
+    `mode` is `byte` for any data, or `numeric` or `alphanumeric` for payloads made only of those characters,
+    in which case the result is a number of characters.
+    """
+
+    bits = CAPACITY_BITS[error_correction][40]
+
+    if mode == "numeric":
+        remaining = bits - 4 - util.length_in_bits(util.MODE_NUMBER, 40)
+        per_code = 3 * (remaining // 10) + (2 if remaining % 10 >= 7 else 1 if remaining % 10 >= 4 else 0)
+    elif mode == "alphanumeric":
+        remaining = bits - 4 - util.length_in_bits(util.MODE_ALPHA_NUM, 40)
+        per_code = 2 * (remaining // 11) + (1 if remaining % 11 >= 6 else 0)
+    elif mode == "byte":
+        per_code = (bits - 4 - util.length_in_bits(util.MODE_8BIT_BYTE, 40)) // 8
+    else:
+        raise ValueError("unknown mode, valid modes are byte, numeric and alphanumeric")
+
+    return per_code * 3
@@ -1,22 +1,35 @@
 import argparse
-from PIL import Image
-from .encode import Encoder
-from .decode import Decoder
+import json
+import sys
+from .archive import result_fields
+from . import daemon
 
 def main():
     """
     Main CLI function.
     Called by running `chromaqr` at the command line.
+
+    Each command imports only what it needs, so commands handled by the daemon start without loading PIL, qrcode or pyzbar.
     """
 
     parser = argparse.ArgumentParser(description="Get three times the data into a QR code using RGB.")
-    parser.add_argument("command", choices=["encode", "decode", "serve"], help="command to perform, must be encode, decode, or serve")
-    parser.add_argument("--inFile", type=str, help="path to input file")
+    parser.add_argument("command", choices=["encode", "decode", "decode-batch", "serve", "bench", "daemon"], help="command to perform, must be encode, decode, decode-batch, serve, bench, or daemon")
+    parser.add_argument("--inFile", type=str, help="path to input file, or for decode-batch a directory, glob pattern, or tar or zip archive")
     parser.add_argument("--text", type=str, help="text to encode")
     parser.add_argument("--outFile", type=str, help="path to output file")
     parser.add_argument("--debug", action="store_true", help="whether to decode in debug mode")
+    parser.add_argument("--video", action="store_true", help="whether to decode --inFile as a video, animated image, or directory or glob pattern of frames, writing each payload as it appears")
     parser.add_argument("--errorCorrection", choices=["LOW", "MED", "HIGH", "MAX"], default="MED", help="level of error correction to use")
+    parser.add_argument("--boxSize", type=int, default=10, help="size of each module of an encoded code in pixels")
+    parser.add_argument("--border", type=int, default=4, help="width of the quiet zone around an encoded code in modules")
     parser.add_argument("--port", type=int, default=8000, help="port to host the server on")
+    parser.add_argument("--workers", type=int, help="number of worker processes for decode-batch or the async server, defaults to the number of CPUs")
+    parser.add_argument("--order", choices=["input", "completion"], default="input", help="whether decode-batch writes results in input order or as they finish")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times bench runs each case")
+    parser.add_argument("--baseline", type=str, help="path to an earlier bench report to check for regressions against")
+    parser.add_argument("--socket", type=str, help="path to the socket of the daemon, defaults to a per-user socket in $XDG_RUNTIME_DIR or the temporary directory")
+    parser.add_argument("--noDaemon", action="store_true", help="whether to encode or decode in this process even if a daemon is running")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="whether to serve with the asynchronous server, which requires aiohttp")
     args = parser.parse_args()
 
     if args.command == "encode":
@@ -26,30 +39,173 @@ def main():
         else:
             inputBytes = args.text.encode("utf-8")
 
-        encoder = Encoder(error_correction=args.errorCorrection)
-        image = encoder.encode(inputBytes)
+        if args.outFile == None:
+            print("error: you must provide an --outFile to encode to")
+            return
 
-        if args.outFile != None:
-            image.save(args.outFile)
+        # The daemon only writes PNGs, so other formats are always saved here from the extension of the output file,
+        # as are options which do not fit in a request to the daemon
+        try:
+            use_daemon = not args.noDaemon and args.outFile.lower().endswith(".png")
+            png = daemon.encode(inputBytes, args.errorCorrection, args.boxSize, args.border, path=args.socket) if use_daemon else None
+        except (OSError, ValueError):
+            png = None
+        except daemon.DaemonError as e:
+            print("error: {}".format(e))
+            return
+
+        if png is not None:
+            with open(args.outFile, "wb") as f:
+                f.write(png)
         else:
-            print("error: you must provide an --outFile to encode to")
+            from .encode import Encoder
+            try:
+                encoder = Encoder(error_correction=args.errorCorrection, box_size=args.boxSize, border=args.border)
+            except ValueError as e:
+                print("error: {}".format(e))
+                return
+            encoder.encode(inputBytes).save(args.outFile)
     
     elif args.command == "decode":
-        if args.inFile != None:
-            inputImage = Image.open(args.inFile)
-        else:
+        if args.inFile == None:
             print("error: you must provide an --inFile to decode")
             return
 
-        decoder = Decoder(debug=args.debug)
-        decoded_bytes = decoder.decode(inputImage)
+        if args.video:
+            from .decode import Decoder
+            from .video import VideoDecoder, iter_frames
+
+            decoder = VideoDecoder(Decoder(debug=args.debug))
+            output = open(args.outFile, "w") if args.outFile != None else sys.stdout
+
+            try:
+                for result in decoder.decode_frames(iter_frames(args.inFile)):
+                    if not result.changed:
+                        continue
+
+                    line = {"frame": result.index, "success": result.result != b""}
+                    if result.result != b"":
+                        line.update(result_fields(result.result))
+                        line["coordinates"] = result.coordinates
+                    else:
+                        line["error"] = "the code was lost"
+
+                    output.write(json.dumps(line) + "\n")
+                    output.flush()
+            except ImportError:
+                print("error: decoding video files requires imageio, install it with `pip install chromaqr[video]`")
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+            return
+
+        # Debug images are saved by whichever process decodes, so debugging always decodes here
+        try:
+            if args.noDaemon or args.debug:
+                decoded_bytes = None
+            else:
+                with open(args.inFile, "rb") as f:
+                    decoded_bytes = daemon.decode(f.read(), path=args.socket)
+        except (OSError, daemon.DaemonError):
+            decoded_bytes = None
+
+        if decoded_bytes is None:
+            from PIL import Image
+            from .decode import Decoder
+            decoder = Decoder(debug=args.debug)
+            decoded_bytes = decoder.decode(Image.open(args.inFile))
 
         if args.outFile != None:
             with open(args.outFile, "wb") as f:
                 f.write(decoded_bytes)
         else:
-            print(decoded_bytes.decode())
+            fields = result_fields(decoded_bytes)
+            print(fields["result"])
+            if "encoding" in fields:
+                print("note: the result is not valid UTF-8, so it was printed base64-encoded, use --outFile to write the raw bytes", file=sys.stderr)
+
+    elif args.command == "decode-batch":
+        if args.inFile == None:
+            print("error: you must provide an --inFile to decode")
+            return
+
+        from .decode import Decoder
+        from .sources import iter_sources
+
+        names = {}
+        def sources():
+            for index, (name, source) in enumerate(iter_sources(args.inFile)):
+                names[index] = name
+                yield source
+
+        decoder = Decoder(debug=args.debug)
+        output = open(args.outFile, "w") if args.outFile != None else sys.stdout
+
+        try:
+            for result in decoder.decode_many(sources(), workers=args.workers, ordered=args.order == "input"):
+                line = {"name": names.pop(result.index), "success": result.result != b""}
+
+                if result.error != None:
+                    line["error"] = result.error
+                elif result.result != b"":
+                    line.update(result_fields(result.result))
+                    line["coordinates"] = result.coordinates
+                else:
+                    line["error"] = "no ChromaQR code was found in the image"
+
+                output.write(json.dumps(line) + "\n")
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
 
     elif args.command == "serve":
-        from .server import run
-        run(port=args.port)
\ No newline at end of file
+        if args.use_async:
+            try:
+                from .aserver import run
+            except ImportError:
+                print("error: the async server requires aiohttp, install it with `pip install chromaqr[async]`")
+                return
+            run(port=args.port, workers=args.workers)
+        else:
+            from .server import run
+            run(port=args.port)
+
+    elif args.command == "daemon":
+        try:
+            daemon.serve(args.socket)
+        except OSError as e:
+            print("error: {}".format(e))
+
+    elif args.command == "bench":
+        from .bench import run, compare
+
+        def describe(result):
+            case = "{operation:6} {error_correction:4} {payload_bytes:5}B".format(**result)
+            if result["operation"] == "decode":
+                case += " {} {}x{}".format(result["variant"], *result["resolution"])
+            return case
+
+        def progress(result):
+            line = "{:40} p50 {p50_ms:9.2f}ms p99 {p99_ms:9.2f}ms {throughput_per_s:8.2f}/s".format(describe(result), **result)
+            if "success_rate" in result:
+                line += " {:.0%} decoded".format(result["success_rate"])
+            print(line)
+
+        report = run(repeat=args.repeat, progress=progress)
+
+        if args.outFile != None:
+            with open(args.outFile, "w") as f:
+                json.dump(report, f, indent=2)
+
+        if args.baseline != None:
+            with open(args.baseline) as f:
+                regressions = compare(json.load(f), report)
+
+            for old, new in regressions:
+                print("regression: {} p50 {:.2f}ms -> {:.2f}ms, {:.0%} -> {:.0%} decoded".format(
+                    describe(new), old["p50_ms"], new["p50_ms"], old.get("success_rate", 1), new.get("success_rate", 1)
+                ))
+
+            if len(regressions) > 0:
+                sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import os
+import signal
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+
+# Header of a request: the command, the error correction level as an index into `LEVELS`, the box size and border for encoding,
+# and the length of the payload which follows, which is the data to encode or the bytes of an image file to decode.
+REQUEST_HEADER = struct.Struct(">BBHHI")
+# Header of a response: the status, then the length of the body which follows, which is a PNG for an encode,
+# the decoded bytes for a decode (empty if no code was found), or a UTF-8 error message.
+RESPONSE_HEADER = struct.Struct(">BI")
+
+ENCODE, DECODE = 1, 2
+OK, ERROR = 0, 1
+LEVELS = ("LOW", "MED", "HIGH", "MAX")
+
+# Largest payload the daemon accepts in one request.
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+class DaemonError(RuntimeError):
+    """Raised by the client when the daemon could not carry out a request."""
+
+def default_socket_path() -> str:
+    """
+    Return the path of the socket the daemon listens on, which can be changed with the `CHROMAQR_SOCKET` environment variable.
+    By default, each user's socket is in their runtime directory, `$XDG_RUNTIME_DIR`,
+    or otherwise in a directory of their own in the temporary directory, which only they can open.
+    """
+
+    if "CHROMAQR_SOCKET" in os.environ:
+        return os.environ["CHROMAQR_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "chromaqr.sock")
+
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), "chromaqr-{}".format(uid), "daemon.sock")
+
+def _check_owner(path: str):
+    """
+    Raise `PermissionError` if the socket, or the directory it is in, belongs to another user,
+    who could otherwise pose as the daemon and read every request sent to it.
+    The directory may also belong to root, like the temporary directory.
+    """
+
+    if not hasattr(os, "getuid"):
+        return
+
+    uid = os.getuid()
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.stat(directory).st_uid not in (uid, 0):
+        raise PermissionError("{} belongs to another user".format(directory))
+    if os.path.lexists(path) and os.lstat(path).st_uid != uid:
+        raise PermissionError("{} belongs to another user".format(path))
+
+def _read_exactly(connection: socket.socket, length: int) -> bytes:
+    """Read exactly `length` bytes, or return `None` if the connection was closed before any were read."""
+
+    chunks = []
+    remaining = length
+    while remaining > 0:
+        chunk = connection.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            if remaining == length:
+                return None
+            raise ConnectionError("the connection was closed in the middle of a message")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b"".join(chunks)
+
+def _request(command: int, payload: bytes, error_correction: str = "MED", box_size: int = 10, border: int = 4, path: str = None, timeout: float = 60) -> bytes:
+    """
+    Send one request to the daemon and return the body of its response.
+    Raises `OSError` if no daemon is listening or the socket belongs to another user, `DaemonError` if the daemon reported an error,
+    and `ValueError` if the options or the payload do not fit in the header of a request.
+    """
+
+    try:
+        header = REQUEST_HEADER.pack(command, LEVELS.index(error_correction), box_size, border, len(payload))
+    except struct.error as e:
+        raise ValueError("the request cannot be sent to the daemon: {}".format(e))
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix domain sockets are not available on this platform")
+
+    path = path or default_socket_path()
+    _check_owner(path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path)
+        connection.sendall(header + payload)
+
+        header = _read_exactly(connection, RESPONSE_HEADER.size)
+        if header is None:
+            raise ConnectionError("the daemon closed the connection without responding")
+        status, length = RESPONSE_HEADER.unpack(header)
+        body = _read_exactly(connection, length) if length > 0 else b""
+
+    if status != OK:
+        raise DaemonError(body.decode("utf-8", errors="replace"))
+    return body
+
+def encode(data: bytes, error_correction: str = "MED", box_size: int = 10, border: int = 4, path: str = None) -> bytes:
+    """Encode data with a running daemon, returning the PNG file of the code."""
+
+    return _request(ENCODE, bytes(data), error_correction, box_size, border, path)
+
+def decode(image_bytes: bytes, path: str = None) -> bytes:
+    """Decode the bytes of an image file with a running daemon, returning the decoded bytes, which are empty if no code was found."""
+
+    return _request(DECODE, image_bytes, path=path)
+
+def is_running(path: str = None) -> bool:
+    """Check whether a daemon is listening on the socket, and the socket belongs to the current user."""
+
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+
+    path = path or default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            _check_owner(path)
+            connection.connect(path)
+            return True
+        except OSError:
+            return False
+
+class _Worker:
+    """Encoders and a decoder which are kept warm between requests."""
+
+    def __init__(self):
+        self.encoders = {}
+        self.decoder = None
+
+    def encode(self, data: bytes, level: int, box_size: int, border: int) -> bytes:
+        from .encode import Encoder
+        from io import BytesIO
+
+        key = (level, box_size, border)
+        if key not in self.encoders:
+            self.encoders[key] = Encoder(error_correction=LEVELS[level], box_size=box_size, border=border)
+
+        output_data = BytesIO()
+        self.encoders[key].encode(data).save(output_data, "png")
+        return output_data.getvalue()
+
+    def decode(self, image_bytes: bytes) -> bytes:
+        from .decode import Decoder
+        from PIL import Image
+        from io import BytesIO
+
+        if self.decoder is None:
+            self.decoder = Decoder()
+        return self.decoder.decode(Image.open(BytesIO(image_bytes)))
+
+class _WorkerPool:
+    """
+    Warm workers shared by every connection. Each request borrows an idle worker, or a new one if they are all busy,
+    so concurrent requests never share an encoder's buffers and no worker goes cold between connections.
+    """
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> _Worker:
+        with self._lock:
+            return self._idle.pop() if self._idle else _Worker()
+
+    def release(self, worker: _Worker):
+        with self._lock:
+            self._idle.append(worker)
+
+def _handle(connection: socket.socket, workers: _WorkerPool):
+    """Answer requests on a connection until the client closes it."""
+
+    while True:
+        header = _read_exactly(connection, REQUEST_HEADER.size)
+        if header is None:
+            return
+
+        command, level, box_size, border, length = REQUEST_HEADER.unpack(header)
+        if length > MAX_MESSAGE_BYTES:
+            message = "the payload is larger than {} bytes".format(MAX_MESSAGE_BYTES).encode("utf-8")
+            connection.sendall(RESPONSE_HEADER.pack(ERROR, len(message)) + message)
+            return
+        payload = _read_exactly(connection, length) if length > 0 else b""
+
+        worker = workers.acquire()
+        try:
+            if command == ENCODE:
+                status, body = OK, worker.encode(payload, level, box_size, border)
+            elif command == DECODE:
+                status, body = OK, worker.decode(payload)
+            else:
+                status, body = ERROR, "unknown command {}".format(command).encode("utf-8")
+        except Exception as e:
+            status, body = ERROR, "{}: {}".format(type(e).__name__, e).encode("utf-8")
+        finally:
+            workers.release(worker)
+
+        connection.sendall(RESPONSE_HEADER.pack(status, len(body)) + body)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            _handle(self.request, self.server.workers)
+        except (OSError, struct.error):
+            pass
+
+def create_server(path: str = None):
+    """
+    Bind the daemon's socket and return the server, without starting it.
+    Call `serve_forever()` on it to answer requests, each connection in its own thread, and `shutdown()` from another thread to stop it.
+    A socket left behind by a daemon which is no longer running is replaced, unless it belongs to another user.
+    """
+
+    if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+        raise OSError("Unix domain sockets are not available on this platform")
+
+    path = path or default_socket_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    _check_owner(path)
+    if os.path.lexists(path):
+        if is_running(path):
+            raise OSError("a daemon is already listening on {}".format(path))
+        os.remove(path)
+
+    # Import everything up front, so that the first request is as fast as the rest
+    from . import encode, decode
+
+    # Only the user running the daemon can connect to it
+    umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, _Handler)
+    finally:
+        os.umask(umask)
+
+    server.daemon_threads = True
+    server.workers = _WorkerPool()
+    return server
+
+def serve(path: str = None):
+    """Run the daemon in the foreground until it is interrupted, then remove its socket."""
+
+    server = create_server(path)
+    print("listening on {}".format(server.server_address))
+
+    # Service managers stop the daemon with SIGTERM, which should clean up like an interrupt
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(server.server_address):
+            os.remove(server.server_address)
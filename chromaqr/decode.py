@@ -1,69 +1,672 @@
-from PIL import Image, ImageEnhance, ImageOps
+from PIL import Image
 from pyzbar import pyzbar
+from .grid import locate_grid, sample_grid
+from .bitstream import decode_modules
+from .metrics import timer
+from .ingest import MAX_IMAGE_PIXELS, open_frame
+from .strategy import DecodeStrategy, BASIC
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from io import BytesIO
+from time import perf_counter
+import numpy as np
+import math
+import os
+
+# Result of decoding one image with `Decoder.decode_many`.
+# `index` is the position of the image in the input, and `error` is set if the image could not be opened.
+BatchResult = namedtuple("BatchResult", "index result coordinates error")
+
+# One of the codes found by `Decoder.decode_all`: its decoded bytes and the corners of its red code.
+CodeResult = namedtuple("CodeResult", "result coordinates")
+
+_CHANNELS = ("red", "green", "blue")
+
+# Lookup table equivalent to `ImageOps.colorize(..., blackpoint=100, whitepoint=180)`.
+# Values below the black point become black, values above the white point become white,
+# and values in between are stretched linearly.
+_THRESHOLD_LUT = np.concatenate((
+    np.zeros(100, dtype=np.uint8),
+    (np.arange(80) * 255 // 80).astype(np.uint8),
+    np.full(76, 255, dtype=np.uint8)
+))
+
+def _binarize(pixels: np.ndarray) -> np.ndarray:
+    """
+    Contrast stretch and threshold all three channels of an RGB array in one pass.
+    Returns a `(3, height, width)` array of 8-bit planes, one for each channel.
+
+    This is equivalent to running `ImageOps.autocontrast` followed by `ImageOps.colorize`
+    on each channel separately, but the two steps are folded into a single lookup table per
+    channel so no intermediate images are created.
+    """
+
+    low = pixels.min(axis=(0, 1)).astype(np.int32)
+    high = pixels.max(axis=(0, 1)).astype(np.int32)
+    levels = np.arange(256, dtype=np.int32)
+
+    luts = np.empty((3, 256), dtype=np.uint8)
+    for channel in range(3):
+        if high[channel] > low[channel]:
+            scale = 255.0 / (high[channel] - low[channel])
+            stretched = (levels * scale - low[channel] * scale).astype(np.int32)
+            stretched = np.clip(stretched, 0, 255)
+        else:
+            stretched = levels
+        luts[channel] = _THRESHOLD_LUT[stretched]
+
+    return luts[np.arange(3)[:, None, None], np.moveaxis(pixels, 2, 0)]
+
+def _binarize_otsu(pixels: np.ndarray) -> np.ndarray:
+    """
+    Threshold each channel of an RGB array at the level which best separates its histogram into two classes.
+    Returns a `(3, height, width)` array of 8-bit planes like `_binarize`.
+    """
+
+    planes = np.empty((3,) + pixels.shape[:2], dtype=np.uint8)
+    levels = np.arange(256, dtype=np.float64)
+
+    for channel in range(3):
+        histogram = np.bincount(pixels[:, :, channel].ravel(), minlength=256).astype(np.float64)
+        weights = np.cumsum(histogram)
+        means = np.cumsum(histogram * levels)
+
+        # Between-class variance for every threshold, leaving out thresholds with an empty class
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = (means[-1] * weights - means * weights[-1]) ** 2 / (weights * (weights[-1] - weights))
+        threshold = int(np.argmax(np.nan_to_num(variance, nan=0.0, posinf=0.0)))
+
+        planes[channel] = np.where(pixels[:, :, channel] > threshold, 255, 0)
+
+    return planes
+
+def _binarize_adaptive(pixels: np.ndarray, offset: int = 8) -> np.ndarray:
+    """
+    Threshold each channel of an RGB array against the mean of the surrounding pixels, which copes with uneven lighting.
+    The window is an eighth of the shorter side of the image. Returns a `(3, height, width)` array of 8-bit planes like `_binarize`.
+    """
+
+    height, width = pixels.shape[:2]
+    radius = max(min(height, width) // 16, 4)
+    area = (2 * radius + 1) ** 2
+    planes = np.empty((3, height, width), dtype=np.uint8)
+
+    for channel in range(3):
+        # Box sums from an integral image of the channel, padded by repeating the edges
+        padded = np.pad(pixels[:, :, channel], radius, mode="edge").astype(np.int64)
+        integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int64)
+        integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+
+        size = 2 * radius + 1
+        sums = integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+        planes[channel] = np.where(pixels[:, :, channel].astype(np.int64) * area < sums - offset * area, 0, 255)
+
+    return planes
+
+def _white_balance(pixels: np.ndarray) -> np.ndarray:
+    """
+    Stretch each channel of an RGB array so that its 2nd and 98th percentiles become black and white,
+    which removes colour casts and ignores small highlights and shadows.
+    """
+
+    sample = pixels[::4, ::4].reshape(-1, 3)
+    low, high = np.percentile(sample, [2, 98], axis=0)
+    scale = 255.0 / np.maximum(high - low, 1)
+
+    luts = np.clip((np.arange(256)[None, :] - low[:, None]) * scale[:, None], 0, 255).astype(np.uint8)
+    return np.stack([luts[channel][pixels[:, :, channel]] for channel in range(3)], axis=2)
+
+def _unmix(pixels: np.ndarray, iterations: int = 2) -> np.ndarray:
+    """
+    Undo the crosstalk between the colour channels of a camera, so that each channel holds one code again.
+
+    Every pixel is modelled as a 3x3 mixing matrix applied to the three layers, between a black point and a white point.
+    The white point is taken from the brightest pixels, which are the quiet zone, and the black point from the darkest,
+    which are the finder patterns and other modules where all three layers are dark. The off-diagonal terms are then
+    fitted by least squares to a sample of pixels classified against those two points, and the inverse of the matrix
+    is applied to every pixel in one pass. If the matrix cannot be estimated, the channels are only stretched.
+    """
+
+    sample = pixels[::4, ::4].reshape(-1, 3).astype(np.float32)
+    luminance = sample.sum(axis=1)
+    low, high = np.percentile(luminance, [2, 98])
+    black = sample[luminance <= low].mean(axis=0)
+    white = sample[luminance >= high].mean(axis=0)
+    span = np.maximum(white - black, 1)
+
+    normalised = (sample - black) / span
+    unmixing = np.eye(3, dtype=np.float32)
+
+    for _ in range(iterations):
+        # Least squares through the 3x3 normal equations, which is much cheaper than a general solver on every sampled pixel
+        layers = (normalised @ unmixing.T > 0.5).astype(np.float32)
+        gram = layers.T @ layers
+        # Each layer must appear on its own somewhere, and the matrix must be far from singular to be worth inverting
+        if np.linalg.cond(gram) > 1000:
+            break
+        mixing = np.linalg.solve(gram, layers.T @ normalised)
+        if np.linalg.cond(mixing) > 20:
+            break
+        unmixing = np.linalg.inv(mixing.T).astype(np.float32)
+
+    # Normalising and unmixing are folded into one affine transform, so the full image is only converted once
+    transform = (unmixing / span[None, :]).T * 255
+    separated = np.dot(pixels.reshape(-1, 3).astype(np.float32), transform)
+    separated -= black @ transform
+    return np.clip(separated, 0, 255, out=separated).astype(np.uint8).reshape(pixels.shape)
+
+_THRESHOLDS = {"fixed": _binarize, "otsu": _binarize_otsu, "adaptive": _binarize_adaptive}
+_SEPARATIONS = {"rgb": None, "white_balance": _white_balance, "unmix": _unmix}
+
+def _to_array(image: Image) -> np.ndarray:
+    """
+    Convert a PIL Image into an RGB array.
+    Transparent pixels are replaced with white so the codes stay readable,
+    in place in the one copy of the pixels rather than by compositing onto a new canvas.
+    """
+
+    if image.mode in ("LA", "PA", "RGBa", "La") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+
+    if image.mode == "RGBA":
+        pixels = np.array(image)
+        np.copyto(pixels[:, :, :3], 255, where=pixels[:, :, 3:] < 255)
+        return pixels[:, :, :3]
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    return np.asarray(image)
+
+# Decoder used by each worker process of `Decoder.decode_many` and the async server.
+_worker_decoder = None
+
+def _init_worker(debug: bool, locate_once: bool, rungs: list = None, time_budget: float = None):
+    global _worker_decoder
+    strategy = DecodeStrategy(rungs, time_budget) if rungs is not None else None
+    _worker_decoder = Decoder(debug=debug, locate_once=locate_once, strategy=strategy)
+
+def _decode_source(index: int, source) -> BatchResult:
+    """Open and decode a single image from a file path or bytes, for use in a worker process."""
+
+    try:
+        image = Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        result = _worker_decoder.decode(image)
+    except Exception as e:
+        return BatchResult(index, b"", None, str(e))
+
+    return BatchResult(index, result, _worker_decoder.code_quad if result != b"" else None, None)
+
+def _decode_all_source(source) -> list:
+    """Open the bytes of an image file and decode every code in it, for use in a worker process."""
+
+    return _worker_decoder.decode_all(Image.open(BytesIO(source)))
+
+def _track_source(frame: bytes, code_quad: list, max_pixels: int = MAX_IMAGE_PIXELS) -> BatchResult:
+    """
+    Decode one frame of a sequence from raw pixels or the bytes of an image file, as read by `open_frame`, for use in a worker process.
+    The frame is opened here rather than by the caller, so an event loop never spends time on its pixels.
+    The corners of the code in the previous frame are passed in, since a worker may not have seen that frame.
+    """
+
+    try:
+        image = open_frame(frame, max_pixels)
+        _worker_decoder.code_quad = code_quad
+        result = _worker_decoder.track(image)
+    except Exception as e:
+        return BatchResult(0, b"", None, str(e))
+
+    return BatchResult(0, result, _worker_decoder.code_quad, None)
 
 class Decoder:
     """
     Base decoder for QR codes.
-    Currently cannot be customised.
+    Initialised by optionally enabling debug mode.
+
+    If `locate_once` is `True`, the codes are read straight from the module grid found for the red code,
+    only falling back to searching for the green and blue codes separately if that fails.
+    Reading the modules directly also keeps binary payloads intact, as pyzbar converts the text encoding of what it reads.
+
+    If a `Metrics` object (or any object with its `timing`, `count` and `observe` methods) is given as `metrics`,
+    the time spent in each stage, the channels which could not be found and the sizes of the images are reported to it.
+
+    `strategy` is a `DecodeStrategy` describing the ladder of scales, thresholds and colour separations to try.
+    By default only the basic fixed threshold is tried.
+
+    After each decode, `exact` is `True` if the result was read from the module grid, so its bytes are exactly those encoded,
+    and `False` if the grid could not be located and the codes were read by pyzbar instead, which converts the text encoding
+    of what it reads. Text survives the conversion, but binary payloads may not.
     """
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, locate_once=True, metrics=None, strategy=None):
         self.debug = debug
+        self.locate_once = locate_once
+        self.metrics = metrics
+        self.strategy = strategy if strategy is not None else DecodeStrategy(BASIC)
         self.result = None
         self.code_quad = None
+        self.exact = None
 
-    def decode(self, image: Image) -> bytearray:
+    def _decode_with_grid(self, planes: np.ndarray, code_quad: list) -> bytes:
         """
-        Decode the given PIL Image containing a ChromaQR code into a bytearray.
-        If no QR code can be found, an empty bytearray will be returned.
-        
-        If the `Decoder` object has the property `debug` set to `True`, the program will save the processed image for each of the codes.
+        Read all three codes using the module grid of the red code.
+        Returns `None` if the grid could not be located or any code could not be decoded.
         """
 
-        decoded_bytes = b""
+        try:
+            with timer(self.metrics, "grid"):
+                grid = locate_grid(planes[0], code_quad)
+                return b"".join(decode_modules(sample_grid(plane, grid)) for plane in planes)
+        except ValueError:
+            if self.metrics is not None:
+                self.metrics.count("grid_failures")
+            return None
 
-        if image.mode == "RGBA":
-            converted_image = Image.new("RGB", image.size, (255, 255, 255))
-            mask = image.split()[3]
-            mask = ImageOps.colorize(mask, "#000000", "#ffffff", blackpoint=254, whitepoint=255)
-            mask = mask.convert("1")
-            converted_image.paste(image, mask=mask)
-        else:
-            converted_image = image
+    def _load(self, image: Image):
+        """
+        Load the pixels of an image which was opened lazily, recording its size.
+        Large JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale using draft mode,
+        so the full resolution is never decompressed only to be thrown away by the thumbnail.
+        """
+
+        if self.metrics is not None:
+            self.metrics.observe("image_pixels", image.size[0] * image.size[1], operation="decode")
+
+        width, height = image.size
+        target = self.strategy.max_scale
+
+        if image.format == "JPEG" and getattr(image, "tile", None) and max(width, height) > target:
+            # Draft mode picks the smallest scale which is still at least as large as the thumbnail,
+            # so the strategy sees the same detail as it would from the full resolution
+            scale = max(width, height) / target
+            image.draft("RGB", (math.ceil(width / scale), math.ceil(height / scale)))
+
+        with timer(self.metrics, "load"):
+            image.load()
+
+    def _thumbnail(self, image: Image, scale: int):
+        if image.size[0] > scale or image.size[1] > scale:
+            with timer(self.metrics, "thumbnail"):
+                image.thumbnail((scale, scale))
+
+    def _prepare(self, image: Image) -> np.ndarray:
+        """Downscale large images in place to the largest scale of the strategy and binarize all three channels with the fixed threshold."""
+
+        self._thumbnail(image, self.strategy.max_scale)
+
+        with timer(self.metrics, "flatten"):
+            pixels = _to_array(image)
+        with timer(self.metrics, "binarize"):
+            return _binarize(pixels)
+
+    def _separate(self, base: np.ndarray, rung, prepared: dict) -> np.ndarray:
+        """Scale and separate the pixels for a rung, sharing the result with later rungs which only differ in their threshold."""
+
+        key = (rung.scale, rung.separation)
+        if key not in prepared:
+            pixels = base
+            if max(base.shape[:2]) > rung.scale:
+                with timer(self.metrics, "thumbnail"):
+                    scaled = Image.fromarray(base)
+                    scaled.thumbnail((rung.scale, rung.scale))
+                    pixels = np.asarray(scaled)
+            if _SEPARATIONS[rung.separation] is not None:
+                with timer(self.metrics, "separate"):
+                    pixels = _SEPARATIONS[rung.separation](pixels)
+            prepared[key] = pixels
+
+        return prepared[key]
+
+    def _climb(self, image: Image, start: float) -> tuple:
+        """
+        Try each rung of the strategy in turn until all three codes are found, or the time budget since `start` runs out.
+        The image is downscaled in place to the largest scale of any rung, and the corners of the code are given relative to it.
+        Returns the decoded bytes, which are empty if every rung failed, and the corners of the red code.
+        """
+
+        rungs = self.strategy.order()
+        budget = self.strategy.time_budget
+        self._thumbnail(image, self.strategy.max_scale)
 
-        if converted_image.size[0] > 1280 or converted_image.size[1] > 1280:
-            converted_image.thumbnail((min(1280, converted_image.size[0]), min(1280, converted_image.size[1])))
+        with timer(self.metrics, "flatten"):
+            base = _to_array(image)
+        prepared = {}
 
+        for attempt, rung in enumerate(rungs):
+            if attempt > 0 and budget is not None and perf_counter() - start > budget:
+                if self.metrics is not None:
+                    self.metrics.count("budget_exhausted")
+                break
+
+            pixels = self._separate(base, rung, prepared)
+            with timer(self.metrics, "binarize"):
+                planes = _THRESHOLDS[rung.threshold](pixels)
+
+            decoded_bytes, code_quad = self._scan(planes, 0, 0, planes.shape[2], planes.shape[1])
+            if decoded_bytes != b"":
+                self.strategy.record(rung)
+                if self.metrics is not None:
+                    self.metrics.count("rung_successes", scale=rung.scale, threshold=rung.threshold, separation=rung.separation)
+
+                factor = base.shape[1] / pixels.shape[1]
+                return decoded_bytes, [[int(round(x * factor)), int(round(y * factor))] for x, y in code_quad]
+
+        return b"", None
+
+    def _scan(self, planes: np.ndarray, left: int, top: int, right: int, bottom: int) -> tuple:
+        """
+        Search for the three codes with pyzbar within a rectangle of the planes.
+        Returns the decoded bytes, which are empty if any code could not be found, and the corners of the red code.
+        """
+
+        decoded_bytes = b""
         code_quad = None
 
         for i in range(3):
-            rgb_image = ImageOps.autocontrast(converted_image.split()[i])
-            rgb_image = ImageOps.colorize(rgb_image, "#000000", "#ffffff", blackpoint=100, whitepoint=180)
-            decoded_codes = pyzbar.decode(rgb_image, symbols=[pyzbar.ZBarSymbol.QRCODE])
+            with timer(self.metrics, "zbar"):
+                plane = np.ascontiguousarray(planes[i, top:bottom, left:right])
+                decoded_codes = pyzbar.decode(plane, symbols=[pyzbar.ZBarSymbol.QRCODE])
 
             if self.debug:
-                rgb_image.save("debug_{}.png".format(i))
+                Image.fromarray(plane).save("debug_{}.png".format(i))
 
             if len(decoded_codes) == 0:
-                return b""
+                if self.metrics is not None:
+                    self.metrics.count("channel_failures", channel=_CHANNELS[i])
+                return b"", code_quad
 
             decoded_code = decoded_codes[0]
             decoded_bytes += decoded_code.data
-            converted_image = converted_image.crop((
-                decoded_code.rect.left,
-                decoded_code.rect.top,
-                decoded_code.rect.left + decoded_code.rect.width,
-                decoded_code.rect.top + decoded_code.rect.height,
-            ))
 
             if i == 0:
-                code_quad = [
-                    [decoded_code.polygon[0].x, decoded_code.polygon[0].y],
-                    [decoded_code.polygon[1].x, decoded_code.polygon[1].y],
-                    [decoded_code.polygon[2].x, decoded_code.polygon[2].y],
-                    [decoded_code.polygon[3].x, decoded_code.polygon[3].y]
-                ]
+                code_quad = [[int(left + point.x), int(top + point.y)] for point in decoded_code.polygon[:4]]
+
+                if self.locate_once:
+                    grid_bytes = self._decode_with_grid(planes, code_quad)
+                    if grid_bytes is not None:
+                        self.exact = True
+                        return grid_bytes, code_quad
+
+            self.exact = False
+            left, top, right, bottom = (
+                left + decoded_code.rect.left,
+                top + decoded_code.rect.top,
+                left + decoded_code.rect.left + decoded_code.rect.width,
+                top + decoded_code.rect.top + decoded_code.rect.height
+            )
+
+        return decoded_bytes, code_quad
+
+    def _scan_all(self, planes: np.ndarray, run) -> tuple:
+        """
+        Find and decode every code in the planes, with `run` mapping a function over its arguments, possibly in parallel.
+        Each red code is read from its own module grid if `locate_once` is set. Otherwise, or if that fails, it is matched to the
+        green and blue codes whose centres are closest to its own, within half its size.
+        Returns a list of `CodeResult` with corners relative to the planes, and the number of red codes which could not be read.
+        """
+
+        def scan(plane):
+            with timer(self.metrics, "zbar"):
+                return pyzbar.decode(np.ascontiguousarray(plane), symbols=[pyzbar.ZBarSymbol.QRCODE])
+
+        red_codes = scan(planes[0])
+        quads = [[[int(point.x), int(point.y)] for point in code.polygon[:4]] for code in red_codes]
+
+        if self.locate_once:
+            grid_results = list(run(lambda quad: self._decode_with_grid(planes, quad), quads))
+        else:
+            grid_results = [None] * len(red_codes)
+
+        results = [CodeResult(result, quad) for result, quad in zip(grid_results, quads) if result is not None]
+        remaining = [(code, quad) for code, quad, result in zip(red_codes, quads, grid_results) if result is None]
+        if not remaining:
+            return results, 0
+
+        # The green and blue planes are only searched for the red codes which could not be read from their grids
+        counterparts = list(run(scan, planes[1:]))
+        unread = 0
+
+        for code, quad in remaining:
+            x, y = code.rect.left + code.rect.width / 2, code.rect.top + code.rect.height / 2
+            tolerance = max(code.rect.width, code.rect.height) / 2
+            decoded_bytes = code.data
+
+            for channel, candidates in zip(_CHANNELS[1:], counterparts):
+                distances = [math.hypot(c.rect.left + c.rect.width / 2 - x, c.rect.top + c.rect.height / 2 - y) for c in candidates]
+                nearest = int(np.argmin(distances)) if distances else None
+                if nearest is None or distances[nearest] > tolerance:
+                    if self.metrics is not None:
+                        self.metrics.count("channel_failures", channel=channel)
+                    decoded_bytes = None
+                    break
+
+                # Each code can only belong to one ChromaQR code
+                decoded_bytes += candidates.pop(nearest).data
+
+            # Like `decode`, empty bytes mean that no code was read
+            if not decoded_bytes:
+                unread += 1
+            else:
+                results.append(CodeResult(decoded_bytes, quad))
+
+        return results, unread
+
+    def _climb_all(self, image: Image, start: float, run) -> list:
+        """
+        Try each rung of the strategy in turn, collecting every code found, like `_climb` does for a single code.
+        Codes found on earlier rungs are kept, and the climb stops at the first rung which reads every red code it finds.
+        Returns a list of `CodeResult` with corners relative to the downscaled image.
+        """
+
+        rungs = self.strategy.order()
+        budget = self.strategy.time_budget
+        self._thumbnail(image, self.strategy.max_scale)
+
+        with timer(self.metrics, "flatten"):
+            base = _to_array(image)
+        prepared = {}
+        found = []
+
+        for attempt, rung in enumerate(rungs):
+            if attempt > 0 and budget is not None and perf_counter() - start > budget:
+                if self.metrics is not None:
+                    self.metrics.count("budget_exhausted")
+                break
+
+            pixels = self._separate(base, rung, prepared)
+            with timer(self.metrics, "binarize"):
+                planes = _THRESHOLDS[rung.threshold](pixels)
+
+            results, unread = self._scan_all(planes, run)
+            factor = base.shape[1] / pixels.shape[1]
+            new_codes = 0
+
+            for result, quad in results:
+                quad = [[int(round(x * factor)), int(round(y * factor))] for x, y in quad]
+                x, y = np.mean(quad, axis=0)
+
+                # A code found again by a later rung lies within the corners of the one found before
+                corners = [np.array(code.coordinates) for code in found]
+                if not any((c.min(axis=0) <= (x, y)).all() and ((x, y) <= c.max(axis=0)).all() for c in corners):
+                    found.append(CodeResult(result, quad))
+                    new_codes += 1
+
+            if new_codes > 0:
+                self.strategy.record(rung)
+                if self.metrics is not None:
+                    self.metrics.count("rung_successes", scale=rung.scale, threshold=rung.threshold, separation=rung.separation)
+            if found and unread == 0:
+                break
+
+        return found
+
+    def decode_all(self, image: Image, workers: int = 1) -> list:
+        """
+        Decode every ChromaQR code in the given PIL Image, such as a sheet of labels, in one pass over the image.
+        Returns a list of `CodeResult` tuples holding the decoded bytes and the corners of each red code,
+        in reading order from top to bottom and left to right, which is empty if no code was found.
+
+        All the red codes are found in a single scan, and the green and blue codes are matched to them by their positions.
+        If `workers` is more than one, the codes are read and the channels are scanned in parallel in a pool of threads,
+        which run at the same time since NumPy and zbar release the GIL while they work.
+        The strategy is climbed as in `decode`, except that every code found on any rung is kept.
+        """
+
+        start = perf_counter()
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        run = executor.map if executor is not None else map
+
+        try:
+            self._load(image)
+            found = self._climb_all(image, start, run)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if self.metrics is not None:
+            self.metrics.count("decodes", result="success" if found else "failure")
+            self.metrics.observe("codes_found", len(found))
+
+        return sorted(found, key=lambda code: (min(y for _, y in code.coordinates), min(x for x, _ in code.coordinates)))
+
+    def decode(self, image: Image) -> bytearray:
+        """
+        Decode the given PIL Image containing a ChromaQR code into a bytearray.
+        If no QR code can be found, an empty bytearray will be returned.
+
+        If the `Decoder` object has the property `debug` set to `True`, the program will save the processed image for each of the codes.
+        Large JPEGs which have not been loaded yet are decoded at a reduced scale, no smaller than the largest scale of the strategy.
+        Each rung of the decoder's strategy is tried in turn, stopping at the first one where all three codes are found.
+        Binary payloads are only returned intact when they are read from the module grid, which `exact` reports.
+        """
+
+        start = perf_counter()
+        self._load(image)
+        decoded_bytes, code_quad = self._climb(image, start)
+
+        if self.metrics is not None:
+            self.metrics.count("decodes", result="success" if decoded_bytes != b"" else "failure")
+
+        if decoded_bytes != b"":
+            self.result = decoded_bytes
+            self.code_quad = code_quad
+        return decoded_bytes
+
+    def _track_region(self, image: Image) -> tuple:
+        """
+        Binarize only the area around the previous corners of the code, at the scale `_prepare` would downscale the whole frame to,
+        so the rest of the frame is never scaled or thresholded. The area extends half the size of the code beyond its corners.
+        Returns the planes of the area and the position of its top left corner, or `None` if the area is outside the frame.
+        """
+
+        width, height = image.size
+        scale = self.strategy.max_scale
+        factor = max(width, height) / scale if max(width, height) > scale else 1
+        scaled_width, scaled_height = round(width / factor), round(height / factor)
+
+        corners = np.array(self.code_quad)
+        margin = (corners.max(axis=0) - corners.min(axis=0)) // 2
+        left, top = np.maximum(corners.min(axis=0) - margin, 0).astype(int).tolist()
+        right, bottom = np.minimum(corners.max(axis=0) + margin, (scaled_width, scaled_height)).astype(int).tolist()
+        if right - left < 21 or bottom - top < 21:
+            return None
+
+        with timer(self.metrics, "thumbnail"):
+            if factor > 1:
+                x_scale, y_scale = width / scaled_width, height / scaled_height
+                region = image.resize((right - left, bottom - top), box=(left * x_scale, top * y_scale, right * x_scale, bottom * y_scale))
+            else:
+                region = image.crop((left, top, right, bottom))
+
+        with timer(self.metrics, "flatten"):
+            pixels = _to_array(region)
+        with timer(self.metrics, "binarize"):
+            return _binarize(pixels), left, top
+
+    def track(self, image: Image, widen: bool = True) -> bytearray:
+        """
+        Decode one frame of a sequence, such as a camera feed, starting from where the code was found in the previous frame.
+        Only the area around the previous corners is scaled and binarized at first, and the code is read from its previous grid
+        or searched for within that area. The whole frame is only searched if both fail.
+        The position of the code is kept in `code_quad` between frames, and is cleared once the code is lost.
+
+        If `widen` is `False`, the whole frame is not searched while there is a previous position, which is kept if the code is not found,
+        so the caller can decide how many frames to miss before paying for a full search.
+        """
+
+        self._load(image)
+        decoded_bytes = b""
+        code_quad = None
+
+        if self.code_quad is not None:
+            region = self._track_region(image)
+            if region is not None:
+                planes, left, top = region
+                code_quad = [[x - left, y - top] for x, y in self.code_quad]
+                grid_bytes = self._decode_with_grid(planes, code_quad)
+
+                if grid_bytes is not None:
+                    decoded_bytes = grid_bytes
+                    self.exact = True
+                else:
+                    decoded_bytes, code_quad = self._scan(planes, 0, 0, planes.shape[2], planes.shape[1])
+                if decoded_bytes != b"":
+                    code_quad = [[x + left, y + top] for x, y in code_quad]
+
+        searched = self.code_quad is None or widen
+        if decoded_bytes == b"" and searched:
+            planes = self._prepare(image)
+            decoded_bytes, code_quad = self._scan(planes, 0, 0, planes.shape[2], planes.shape[1])
+
+        if self.metrics is not None:
+            self.metrics.count("decodes", result="success" if decoded_bytes != b"" else "failure")
 
         self.result = decoded_bytes
-        self.code_quad = code_quad
-        return decoded_bytes
\ No newline at end of file
+        if decoded_bytes != b"":
+            self.code_quad = code_quad
+        elif searched:
+            self.code_quad = None
+        return decoded_bytes
+
+    def decode_many(self, sources, workers: int = None, ordered: bool = True):
+        """
+        Decode many images in parallel using a pool of worker processes.
+        Each source can be a file path or the bytes of an image file.
+
+        Returns a generator of `BatchResult` tuples, in input order if `ordered` is `True` or in the order they finish otherwise.
+        `workers` defaults to the number of CPUs, and sources are read lazily so only a few images are held in memory at once.
+        """
+
+        workers = workers or os.cpu_count() or 1
+
+        if workers == 1:
+            _init_worker(self.debug, self.locate_once, self.strategy.rungs, self.strategy.time_budget)
+            for index, source in enumerate(sources):
+                yield _decode_source(index, source)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self.debug, self.locate_once, self.strategy.rungs, self.strategy.time_budget)) as executor:
+            window = workers * 4
+            pending = deque() if ordered else set()
+
+            for index, source in enumerate(sources):
+                future = executor.submit(_decode_source, index, source)
+
+                if ordered:
+                    pending.append(future)
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                else:
+                    pending.add(future)
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+
+            if ordered:
+                while pending:
+                    yield pending.popleft().result()
+            else:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
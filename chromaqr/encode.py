@@ -1,19 +1,135 @@
 from PIL import Image
-from qrcode import QRCode, constants
+from .layout import encode_codewords, build_modules
+from .capacity import LEVELS, plan
+from .metrics import timer
 from enum import Enum
-import math
+from io import BytesIO
+import numpy as np
 
 # Error correction: LOW, MEDIUM, HIGH or MAX.
 ErrorCorrection = Enum("ErrorCorrection", "LOW MED HIGH MAX")
 
+# Size of each module in pixels and width of the quiet zone around the code in modules.
+BOX_SIZE = 10
+BORDER = 4
+
+# Output modes of `Encoder`: `RGB`, or `P` for a palette image with one byte per pixel, which is smaller and faster to save as a PNG.
+MODES = ("RGB", "P")
+
+# Palette of the eight colours a module can take, indexed by its red, green and blue bits.
+_PALETTE = [255 * ((index >> shift) & 1) for index in range(8) for shift in (2, 1, 0)]
+
+# File formats `to_bytes` can save a code in, with their MIME types.
+# Both are lossless, since lossy compression would blur the colours of neighbouring modules together.
+IMAGE_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+# Compression level used by `to_bytes` unless another is given, which is also Pillow's default for PNGs.
+COMPRESS_LEVEL = 6
+
+def parse_compress_level(value = COMPRESS_LEVEL) -> int:
+    """Read a compression level for `to_bytes`, such as a request parameter, raising `ValueError` if it is not a level from 0 to 9."""
+
+    try:
+        compress_level = int(value)
+    except (TypeError, ValueError):
+        compress_level = None
+
+    if compress_level is None or not 0 <= compress_level <= 9:
+        raise ValueError("invalid compression level, valid levels are 0 to 9")
+    return compress_level
+
+def to_bytes(image: Image, image_format: str = "png", compress_level: int = COMPRESS_LEVEL) -> bytes:
+    """
+    Save an encoded code as the bytes of a PNG or lossless WebP file.
+    `compress_level` goes from 0, the fastest, to 9, the smallest, and is scaled to the 0 to 6 range of the WebP encoder's `method`.
+    Codes encoded in mode `P` are several times faster to save as PNGs than the same codes in mode `RGB`.
+    """
+
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("unknown image format, valid formats are png and webp")
+    compress_level = parse_compress_level(compress_level)
+
+    output_data = BytesIO()
+    if image_format == "png":
+        image.save(output_data, "png", compress_level=compress_level)
+    else:
+        image.save(output_data, "webp", lossless=True, method=round(compress_level * 6 / 9))
+    return output_data.getvalue()
+
 class Encoder:
     """
     Base encoder for QR codes.
     Initialised by defining the error correction level.
+
+    Each module is drawn as a `box_size` pixel square, with a quiet zone `border` modules wide,
+    and the image is returned in the given `mode`, one of `MODES`.
+
+    If a `Metrics` object (or any object with its `timing`, `count` and `observe` methods) is given as `metrics`,
+    the time spent in each stage and the sizes of the payloads and images are reported to it.
     """
 
-    def __init__(self, error_correction = "MED"):
+    def __init__(self, error_correction = "MED", metrics = None, box_size: int = BOX_SIZE, border: int = BORDER, mode: str = "RGB"):
+        if box_size < 1 or border < 0:
+            raise ValueError("box size must be at least 1 and border cannot be negative")
+        if mode not in MODES:
+            raise ValueError("unknown mode, valid modes are " + ", ".join(MODES))
+
         self.error_correction = ErrorCorrection[error_correction]
+        self.metrics = metrics
+        self.box_size = box_size
+        self.border = border
+        self.mode = mode
+        self._buffers = {}
+
+    def _compose(self, matrices: list) -> np.ndarray:
+        """
+        Combine the module matrices of the three channels into one array with a pixel for each module, including the quiet zone.
+        In `RGB` mode this is a `(modules, modules, 3)` array of colours, and in `P` mode a `(modules, modules)` array of palette indices.
+        """
+
+        size = matrices[0].shape[0]
+        width = size + self.border * 2
+        light = ~np.stack(matrices, axis=2)
+
+        if self.mode == "P":
+            modules = np.full((width, width), 7, dtype=np.uint8)
+            modules[self.border : self.border + size, self.border : self.border + size] = light[:, :, 0] * 4 + light[:, :, 1] * 2 + light[:, :, 2]
+        else:
+            modules = np.full((width, width, 3), 255, dtype=np.uint8)
+            modules[self.border : self.border + size, self.border : self.border + size] = light.astype(np.uint8) * 255
+
+        return modules
+
+    def _render(self, modules: np.ndarray) -> Image:
+        """
+        Scale an array from `_compose` up by the box size in one step, into a PIL Image.
+        The pixel buffer for each size of code is allocated once and reused by later codes.
+        """
+
+        width = modules.shape[0]
+
+        if width not in self._buffers:
+            # Laid out so that it can be read directly as a `width * box_size` square image
+            self._buffers[width] = np.empty((width, self.box_size, width, self.box_size) + modules.shape[2:], dtype=np.uint8)
+
+        buffer = self._buffers[width]
+        buffer[...] = modules[:, None, :, None]
+
+        image = Image.frombytes(self.mode, (width * self.box_size, width * self.box_size), buffer.tobytes())
+        if self.mode == "P":
+            image.putpalette(_PALETTE)
+        return image
+
+    def _modules(self, data: bytearray) -> list:
+        """Split a bytearray between the three channels and build the module matrix of the code for each one."""
+
+        _, level = LEVELS[self.error_correction.name]
+
+        with timer(self.metrics, "codewords"):
+            version, parts = plan(data, self.error_correction.name)
+            codewords = [encode_codewords(segments, version, level) for segments in parts]
+        with timer(self.metrics, "modules"):
+            return build_modules(codewords, version, level)
 
     def encode(self, data: bytearray) -> Image:
         """
@@ -21,31 +137,40 @@ class Encoder:
         Returns a PIL Image which can be saved with `.save("filename.png")`.
         """
 
-        codes = []
-        section_length = math.ceil(len(data) / 3)
-        split_data = [
-            data[0 : section_length],
-            data[section_length : section_length * 2],
-            data[section_length * 2 :]
-        ]
-
-        error_correction_map = {
-            ErrorCorrection.LOW: constants.ERROR_CORRECT_L,
-            ErrorCorrection.MED: constants.ERROR_CORRECT_M,
-            ErrorCorrection.HIGH: constants.ERROR_CORRECT_Q,
-            ErrorCorrection.MAX: constants.ERROR_CORRECT_H
-        }
-
-        target_version = -1
-        for i in range(3):
-            qr_code = QRCode(
-                version = target_version if i > 0 else None,
-                error_correction = error_correction_map[self.error_correction]
-            )
-            qr_code.add_data(split_data[i], optimize=0)
-            qr_code.make()
-            if i == 0: target_version = qr_code.version
-            qr_code_image = qr_code.make_image(fill_color="black", back_color="white")
-            codes.append(qr_code_image.convert("L"))
-
-        return Image.merge("RGB", codes)
\ No newline at end of file
+        matrices = self._modules(data)
+        with timer(self.metrics, "render"):
+            image = self._render(self._compose(matrices))
+
+        if self.metrics is not None:
+            self.metrics.observe("payload_bytes", len(data))
+            self.metrics.observe("image_pixels", image.size[0] * image.size[1], operation="encode")
+
+        return image
+
+    def encode_modules(self, data: bytearray) -> np.ndarray:
+        """
+        Encode a bytearray into a ChromaQR code without rendering it.
+        Returns a uint8 array with one pixel for each module, including the quiet zone, in the encoder's mode,
+        for pipelines which scale the code themselves.
+        """
+
+        matrices = self._modules(data)
+        with timer(self.metrics, "render"):
+            modules = self._compose(matrices)
+
+        if self.metrics is not None:
+            self.metrics.observe("payload_bytes", len(data))
+
+        return modules
+
+    def encode_many(self, iterable):
+        """
+        Encode each bytearray from an iterable into a ChromaQR code.
+        Returns a generator of PIL Images in the same order as the input.
+
+        Version decisions, function patterns and pixel buffers are shared between codes,
+        so this is much faster than encoding each code with a new `Encoder`.
+        """
+
+        for data in iterable:
+            yield self.encode(data)
@@ -0,0 +1,160 @@
+from collections import namedtuple
+from .bitstream import format_distance, format_positions
+import numpy as np
+
+# The location of a QR code's module grid within an image.
+# `homography` maps module coordinates (column, row) to pixel coordinates (x, y) and `size` is the number of modules along each side.
+Grid = namedtuple("Grid", "homography size")
+
+# Offsets within a module, as a fraction of the module size, at which the image is sampled.
+_SAMPLE_OFFSETS = np.array([
+    [0.5, 0.5],
+    [0.3, 0.3],
+    [0.7, 0.3],
+    [0.3, 0.7],
+    [0.7, 0.7]
+])
+
+def _homography(source: list, destination: list) -> np.ndarray:
+    """Solve for the perspective transform mapping four source points onto four destination points."""
+
+    a, b = [], []
+    for (u, v), (x, y) in zip(source, destination):
+        a.append([u, v, 1, 0, 0, 0, -u * x, -v * x])
+        a.append([0, 0, 0, u, v, 1, -u * y, -v * y])
+        b += [x, y]
+
+    return np.append(np.linalg.solve(np.array(a, dtype=float), np.array(b, dtype=float)), 1).reshape(3, 3)
+
+def _project(homography: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Map an `(n, 2)` array of points through a homography."""
+
+    projected = np.column_stack((points, np.ones(len(points)))) @ homography.T
+    return projected[:, :2] / projected[:, 2:]
+
+def _dark(plane: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Return whether the plane is dark at each `(x, y)` point, clamping points to the plane."""
+
+    x = np.clip(np.rint(points[:, 0]).astype(int), 0, plane.shape[1] - 1)
+    y = np.clip(np.rint(points[:, 1]).astype(int), 0, plane.shape[0] - 1)
+    return plane[y, x] < 128
+
+def _finder_fraction(plane: np.ndarray, corner: np.ndarray, opposite: np.ndarray) -> float:
+    """
+    Walk from a corner of the code towards the opposite corner and look for the 1:1:3:1:1 finder pattern.
+    Returns the fraction of the diagonal covered by the finder pattern, or `None` if there is no finder pattern.
+    """
+
+    steps = max(int(np.hypot(*(opposite - corner)) / 2), 16)
+    points = corner + np.outer(np.arange(steps) / (2 * steps), opposite - corner)
+    dark = _dark(plane, points)
+
+    changes = np.flatnonzero(np.diff(dark.astype(np.int8))) + 1
+    bounds = np.concatenate(([0], changes, [steps]))
+    runs = np.diff(bounds)
+    start = 0 if dark[0] else 1
+
+    if len(runs) < start + 5:
+        return None
+
+    pattern = runs[start : start + 5]
+    unit = pattern.sum() / 7
+    for run, expected in zip(pattern, (1, 1, 3, 1, 1)):
+        if abs(run - expected * unit) > unit * 0.75 + 0.5:
+            return None
+
+    return pattern.sum() / (2 * steps)
+
+def _timing_score(plane: np.ndarray, grid: Grid) -> float:
+    """Return the fraction of timing pattern modules which match the expected alternating pattern."""
+
+    between = np.arange(8, grid.size - 8)
+    modules = np.concatenate((
+        np.column_stack((between, np.full(len(between), 6))),
+        np.column_stack((np.full(len(between), 6), between))
+    ))
+    dark = _sample_modules(plane, grid, modules.astype(float))
+    expected = np.concatenate((between, between)) % 2 == 0
+
+    return np.mean(dark == expected)
+
+def _sample_modules(plane: np.ndarray, grid: Grid, modules: np.ndarray) -> np.ndarray:
+    """Sample an `(n, 2)` array of (column, row) modules, returning whether each one is dark."""
+
+    points = (modules[:, None, :] + _SAMPLE_OFFSETS[None, :, :]).reshape(-1, 2)
+    dark = _dark(plane, _project(grid.homography, points)).reshape(-1, len(_SAMPLE_OFFSETS))
+
+    return dark.sum(axis=1) * 2 > len(_SAMPLE_OFFSETS)
+
+def sample_grid(plane: np.ndarray, grid: Grid) -> np.ndarray:
+    """
+    Sample every module of a located grid from a binarized plane.
+    Returns a square boolean matrix where `True` is a dark module.
+    """
+
+    rows, cols = np.indices((grid.size, grid.size))
+    modules = np.column_stack((cols.ravel(), rows.ravel())).astype(float)
+
+    return _sample_modules(plane, grid, modules).reshape(grid.size, grid.size)
+
+def _format_distance(plane: np.ndarray, grid: Grid) -> int:
+    """Sample only the format information next to the top left finder pattern and check it against the valid codewords."""
+
+    rows, cols = format_positions(grid.size)[0]
+    matrix = np.zeros((grid.size, grid.size), dtype=bool)
+    matrix[rows, cols] = _sample_modules(plane, grid, np.column_stack((cols, rows)).astype(float))
+
+    return format_distance(matrix)
+
+def locate_grid(plane: np.ndarray, quad: list) -> Grid:
+    """
+    Work out the orientation and module grid of a QR code from the corners of the code in a binarized plane.
+    Raises `ValueError` if the grid cannot be located.
+    """
+
+    if quad is None or len(quad) != 4:
+        raise ValueError("the code must have four corners")
+
+    corners = np.array(quad, dtype=float)
+    fractions = [_finder_fraction(plane, corners[i], corners[(i + 2) % 4]) for i in range(4)]
+    found = [i for i, fraction in enumerate(fractions) if fraction is not None]
+
+    if len(found) == 3:
+        # The corner without a finder pattern is the bottom right
+        candidates = [(set(range(4)) - set(found)).pop()]
+    elif len(found) == 4:
+        # Data modules near the bottom right corner can look like a finder pattern by chance,
+        # so every corner is tried as the bottom right and the grids are compared.
+        candidates = found
+    else:
+        raise ValueError("could not find three finder patterns")
+
+    best, best_score = None, None
+    for bottom_right in candidates:
+        top_left = (bottom_right + 2) % 4
+        estimate = 7 / np.mean([fractions[i] for i in found if i != bottom_right])
+        version = int(round((estimate - 17) / 4))
+
+        for candidate in (version, version - 1, version + 1):
+            if not 1 <= candidate <= 40:
+                continue
+
+            size = candidate * 4 + 17
+            for step in (1, -1):
+                # The two neighbours of the top left corner could be either the top right or the bottom left,
+                # depending on whether the image is mirrored.
+                destination = [corners[top_left], corners[(top_left + step) % 4], corners[bottom_right], corners[(top_left - step) % 4]]
+                grid = Grid(_homography([(0, 0), (size, 0), (size, size), (0, size)], destination), size)
+                timing = _timing_score(plane, grid)
+                if timing < 0.8:
+                    continue
+
+                distance = _format_distance(plane, grid)
+                score = (distance, -timing)
+                if distance <= 3 and (best_score is None or score < best_score):
+                    best, best_score = grid, score
+
+    if best is None:
+        raise ValueError("could not find the module grid")
+
+    return best
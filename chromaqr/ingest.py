@@ -0,0 +1,78 @@
+from PIL import Image
+from tempfile import SpooledTemporaryFile
+from io import BytesIO
+import os
+import struct
+
+# Largest image file accepted by the servers in bytes, and largest image in pixels, which is checked from the file's header
+# before any pixels are decoded. They can be changed with the `CHROMAQR_MAX_IMAGE_BYTES` and `CHROMAQR_MAX_IMAGE_PIXELS` environment variables.
+MAX_IMAGE_BYTES = int(os.environ.get("CHROMAQR_MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get("CHROMAQR_MAX_IMAGE_PIXELS", 24 * 1000 * 1000))
+
+# Header of a raw frame sent to the async server's `/stream`: the pixel format, either `RGB ` or `RGBA`, then the width and height.
+# Frames without this header are treated as image files, such as JPEGs.
+RAW_FRAME_HEADER = struct.Struct(">4sHH")
+
+# Bodies larger than this are spooled to a temporary file on disk instead of being kept in memory.
+SPOOL_BYTES = 1024 * 1024
+
+class PayloadTooLarge(ValueError):
+    """Raised when an image file or its dimensions are larger than the configured limits."""
+
+def read_chunks(file, chunk_size: int = 64 * 1024):
+    """Read a binary file object one chunk at a time."""
+
+    return iter(lambda: file.read(chunk_size), b"")
+
+def spool(chunks, max_bytes: int = MAX_IMAGE_BYTES) -> SpooledTemporaryFile:
+    """
+    Copy an iterable of byte chunks into a temporary file, which stays in memory while it is small.
+    Raises `PayloadTooLarge` as soon as more than `max_bytes` have been read, without reading the rest.
+    Returns the file positioned at its start.
+    """
+
+    file = SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    length = 0
+
+    for chunk in chunks:
+        length += len(chunk)
+        if length > max_bytes:
+            file.close()
+            raise PayloadTooLarge("the image is larger than {} bytes".format(max_bytes))
+        file.write(chunk)
+
+    file.seek(0)
+    return file
+
+def open_image(file, max_pixels: int = MAX_IMAGE_PIXELS) -> Image:
+    """
+    Open an image from a path or file object without decoding its pixels.
+    Raises `PayloadTooLarge` if the dimensions in the header add up to more than `max_pixels`, so decompression bombs are rejected up front.
+    """
+
+    try:
+        image = Image.open(file)
+    except Image.DecompressionBombError:
+        raise PayloadTooLarge("the image has more than {} pixels".format(max_pixels))
+
+    if image.size[0] * image.size[1] > max_pixels:
+        image.close()
+        raise PayloadTooLarge("the image has more than {} pixels".format(max_pixels))
+
+    return image
+
+def open_frame(frame: bytes, max_pixels: int = MAX_IMAGE_PIXELS) -> Image:
+    """
+    Open a frame, which is either raw pixels after a `RAW_FRAME_HEADER` or the bytes of an image file.
+    Raises `PayloadTooLarge` if the frame has more than `max_pixels` pixels.
+    """
+
+    magic = frame[:4]
+    if magic not in (b"RGB ", b"RGBA"):
+        return open_image(BytesIO(frame), max_pixels)
+
+    _, width, height = RAW_FRAME_HEADER.unpack_from(frame)
+    if width * height > max_pixels:
+        raise PayloadTooLarge("the frame has more than {} pixels".format(max_pixels))
+    image = Image.frombytes(magic.decode("ascii").strip(), (width, height), frame[RAW_FRAME_HEADER.size :])
+    return image.convert("RGB") if image.mode == "RGBA" else image
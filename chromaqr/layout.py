@@ -0,0 +1,221 @@
+from functools import lru_cache
+from qrcode import util, exceptions
+from .bitstream import alignment_positions, block_structure, codeword_order, error_correction_codewords, format_bits, format_positions, function_pattern_mask, mask_pattern
+import numpy as np
+
+# Light and dark modules of the finder and alignment patterns.
+_FINDER = np.ones((7, 7), dtype=bool)
+_FINDER[1:6, 1:6] = False
+_FINDER[2:5, 2:5] = True
+
+_ALIGNMENT = np.ones((5, 5), dtype=bool)
+_ALIGNMENT[1:4, 1:4] = False
+_ALIGNMENT[2, 2] = True
+
+# Finder-like pattern with four light modules on one side, which is penalised when choosing a mask.
+_FINDER_LIKE = np.array([1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0], dtype=bool)
+
+def _pack_segment(segment: util.QRData, version: int) -> tuple:
+    """Return the bits of a segment, including its mode and count indicators, as an integer and a bit count."""
+
+    mode, data = segment.mode, segment.data
+    count_bits = util.length_in_bits(mode, version)
+    value, length = (mode << count_bits) | len(data), 4 + count_bits
+
+    if mode == util.MODE_NUMBER:
+        for i in range(0, len(data), 3):
+            group = data[i : i + 3]
+            bits = (4, 7, 10)[len(group) - 1]
+            value, length = (value << bits) | int(group), length + bits
+    elif mode == util.MODE_ALPHA_NUM:
+        for i in range(0, len(data), 2):
+            pair = data[i : i + 2]
+            if len(pair) == 2:
+                value, length = (value << 11) | (util.ALPHA_NUM.find(pair[:1]) * 45 + util.ALPHA_NUM.find(pair[1:])), length + 11
+            else:
+                value, length = (value << 6) | util.ALPHA_NUM.find(pair), length + 6
+    else:
+        value, length = (value << (8 * len(data))) | int.from_bytes(data, "big"), length + 8 * len(data)
+
+    return value, length
+
+def encode_codewords(segments: list, version: int, level: str) -> np.ndarray:
+    """
+    Encode a list of `QRData` segments into the interleaved data and error correction codewords of a version.
+    Raises `DataOverflowError` if the segments do not fit.
+    """
+
+    block_count, ec_count, short_count, short_length = block_structure(version, level)
+    capacity = (short_length - ec_count) * block_count + (block_count - short_count)
+
+    value, length = 0, 0
+    for segment in segments:
+        segment_value, segment_length = _pack_segment(segment, version)
+        value, length = (value << segment_length) | segment_value, length + segment_length
+
+    if length > capacity * 8:
+        raise exceptions.DataOverflowError()
+
+    # Terminator of up to four zero bits, then padding to a whole number of bytes
+    terminator = min(4, capacity * 8 - length)
+    length += terminator
+    padding = -length % 8
+    value, length = value << (terminator + padding), length + padding
+
+    data = np.empty(capacity, dtype=np.uint8)
+    data[: length // 8] = np.frombuffer(value.to_bytes(length // 8, "big"), dtype=np.uint8)
+    data[length // 8 :] = np.resize(np.array([0xec, 0x11], dtype=np.uint8), capacity - length // 8)
+
+    # Split the data into blocks, with the short blocks padded with a zero at the end
+    short_data = short_length - ec_count
+    blocks = np.zeros((block_count, short_data + 1), dtype=np.uint8)
+    blocks[:short_count, :short_data] = data[: short_count * short_data].reshape(short_count, short_data)
+    blocks[short_count:] = data[short_count * short_data :].reshape(block_count - short_count, short_data + 1)
+
+    # Moving the padding to the front leaves the polynomial unchanged, so all blocks can be processed together
+    aligned = blocks.copy()
+    aligned[:short_count] = np.roll(blocks[:short_count], 1, axis=1)
+    ec_blocks = error_correction_codewords(aligned, ec_count).astype(np.uint8)
+
+    # Interleave the data codewords, skipping the padding of the short blocks, then the error correction codewords
+    interleaved = np.concatenate((
+        blocks[:, :short_data].T.ravel(),
+        blocks[short_count:, short_data],
+        ec_blocks.T.ravel()
+    ))
+
+    return interleaved
+
+@lru_cache(maxsize=None)
+def function_patterns(version: int) -> np.ndarray:
+    """
+    Return the finder, timing and alignment patterns, the dark module and version information for a version.
+    Only the modules marked by `function_pattern_mask` are meaningful.
+    """
+
+    size = version * 4 + 17
+    modules = np.zeros((size, size), dtype=bool)
+
+    modules[:7, :7] = _FINDER
+    modules[:7, size - 7:] = _FINDER
+    modules[size - 7:, :7] = _FINDER
+
+    timing = np.arange(8, size - 8) % 2 == 0
+    modules[6, 8 : size - 8] = timing
+    modules[8 : size - 8, 6] = timing
+
+    positions = alignment_positions(version)
+    for row in positions:
+        for col in positions:
+            if (row == 6 and col == 6) or (row == 6 and col == size - 7) or (row == size - 7 and col == 6):
+                continue
+            modules[row - 2 : row + 3, col - 2 : col + 3] = _ALIGNMENT
+
+    modules[size - 8, 8] = True
+
+    if version >= 7:
+        remainder = version
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1f25)
+        bits = (version << 12) | remainder
+        for i in range(18):
+            bit = (bits >> i) & 1 == 1
+            modules[i // 3, size - 11 + i % 3] = bit
+            modules[size - 11 + i % 3, i // 3] = bit
+
+    modules.flags.writeable = False
+    return modules
+
+def _penalties(candidates: np.ndarray) -> np.ndarray:
+    """Score a stack of module matrices using the QR code mask penalty rules, returning one score per matrix."""
+
+    count, size, _ = candidates.shape
+    scores = np.zeros(count, dtype=np.int64)
+
+    for lines in (candidates, candidates.transpose(0, 2, 1)):
+        # Runs of five or more modules of the same colour, with a separator after each line
+        separated = np.full((count, size, size + 1), 2, dtype=np.int8)
+        separated[:, :, :size] = lines
+        flat = separated.ravel()
+        starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+        lengths = np.diff(np.append(starts, len(flat)))
+        long_runs = (flat[starts] != 2) & (lengths >= 5)
+        scores += np.bincount(
+            starts[long_runs] // (size * (size + 1)),
+            weights=lengths[long_runs] - 2,
+            minlength=count
+        ).astype(np.int64)
+
+        # Finder-like patterns
+        for pattern in (_FINDER_LIKE, _FINDER_LIKE[::-1]):
+            matches = np.ones((count, size, size - len(pattern) + 1), dtype=bool)
+            for offset, value in enumerate(pattern):
+                matches &= lines[:, :, offset : size - len(pattern) + 1 + offset] == value
+            scores += 40 * matches.sum(axis=(1, 2))
+
+    # Blocks of two by two modules of the same colour
+    corner = candidates[:, :-1, :-1]
+    blocks = (corner == candidates[:, 1:, :-1]) & (corner == candidates[:, :-1, 1:]) & (corner == candidates[:, 1:, 1:])
+    scores += 3 * blocks.sum(axis=(1, 2))
+
+    # Balance of dark and light modules
+    dark = candidates.mean(axis=(1, 2)) * 100
+    scores += 10 * (np.abs(dark - 50) // 5).astype(np.int64)
+
+    return scores
+
+@lru_cache(maxsize=None)
+def _information_modules(version: int) -> np.ndarray:
+    """Return a boolean matrix which is `True` for the dark module and the version information of a version."""
+
+    size = version * 4 + 17
+    information = np.zeros((size, size), dtype=bool)
+    information[size - 8, 8] = True
+    if version >= 7:
+        information[:6, size - 11 : size - 8] = True
+        information[size - 11 : size - 8, :6] = True
+
+    information.flags.writeable = False
+    return information
+
+def build_modules(codewords: list, version: int, level: str, mask: int = None) -> list:
+    """
+    Lay out each list of interleaved data and error correction codewords as a QR code module matrix, where `True` is dark.
+    If no mask pattern is given, all eight are tried for each code and the one with the lowest penalty is used.
+    Like qrcode, masks are scored with the format information, version information and dark module left light,
+    so the same mask is chosen as `qrcode.QRCode` would choose.
+    Returns a list with one matrix per list of codewords.
+    """
+
+    size = version * 4 + 17
+    rows, cols = codeword_order(version)
+    reserved = function_pattern_mask(version)
+    patterns = function_patterns(version)
+    information = _information_modules(version)
+    masks = list(range(8)) if mask is None else [mask]
+
+    candidates = np.empty((len(codewords), len(masks), size, size), dtype=bool)
+    for i, code_codewords in enumerate(codewords):
+        bits = np.unpackbits(np.asarray(code_codewords, dtype=np.uint8)).astype(bool)
+        data = np.zeros((size, size), dtype=bool)
+        data[rows[: len(bits)], cols[: len(bits)]] = bits
+
+        for j, candidate_mask in enumerate(masks):
+            candidates[i, j] = np.where(reserved, patterns & ~information, data ^ mask_pattern(version, candidate_mask))
+
+    if len(masks) == 1:
+        best_masks = [0] * len(codewords)
+    else:
+        # Every candidate of every code is scored at once
+        scores = _penalties(candidates.reshape(-1, size, size)).reshape(len(codewords), len(masks))
+        best_masks = np.argmin(scores, axis=1)
+
+    modules = []
+    for i, best in enumerate(best_masks):
+        matrix = candidates[i, best] | information & patterns
+        codeword = format_bits(level, masks[best])
+        for format_rows, format_cols in format_positions(size):
+            matrix[format_rows, format_cols] = (codeword >> np.arange(15)) & 1 == 1
+        modules.append(matrix)
+
+    return modules
@@ -0,0 +1,139 @@
+from threading import Lock
+from time import perf_counter
+
+# Upper bounds of the histogram buckets for each observed value.
+BUCKETS = {
+    "stage_seconds": [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+    "image_pixels": [10000, 100000, 250000, 500000, 1000000, 2000000, 4000000, 8000000, 16000000],
+    "payload_bytes": [16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768],
+    "codes_found": [0, 1, 2, 4, 8, 16, 32, 64]
+}
+_DEFAULT_BUCKETS = [0.001, 0.01, 0.1, 1, 10, 100, 1000, 10000, 100000, 1000000]
+
+class _Timer:
+    """Context manager which reports the time spent inside it as a stage timing."""
+
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.timing(self.stage, perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    """Context manager which does nothing, used when instrumentation is turned off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(metrics, stage: str):
+    """Time a stage with a `with` block, or do nothing at all if `metrics` is `None`."""
+
+    return _NULL_TIMER if metrics is None else _Timer(metrics, stage)
+
+def _format_labels(labels: tuple, extra: str = None) -> str:
+    parts = ['{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels]
+    if extra is not None:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Metrics:
+    """
+    Thread-safe collector of stage timings, counters and histograms from `Encoder` and `Decoder`.
+    Any object with the same `timing`, `count` and `observe` methods can be passed to them instead,
+    for example to forward the measurements to another monitoring system.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._collectors = []
+        self._lock = Lock()
+
+    def timing(self, stage: str, seconds: float):
+        """Record the time spent in one stage of encoding or decoding."""
+
+        self.observe("stage_seconds", seconds, stage=stage)
+
+    def count(self, name: str, amount: int = 1, **labels):
+        """Add to a counter, such as the number of times a channel could not be found."""
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        """Add a value, such as the size of an image, to a histogram."""
+
+        key = (name, tuple(sorted(labels.items())))
+        buckets = BUCKETS.get(name, _DEFAULT_BUCKETS)
+
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def add_collector(self, collector):
+        """
+        Register a function which is called whenever the metrics are rendered,
+        returning `(name, type, value)` tuples for values kept elsewhere, such as cache statistics.
+        Names are family names, so counters are given without the `_total` suffix, which is added when they are rendered.
+        """
+
+        self._collectors.append(collector)
+
+    def render(self, prefix: str = "chromaqr_") -> str:
+        """Render every metric in the Prometheus text exposition format."""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, ([list(histogram[0])] + histogram[1:])) for key, histogram in self.histograms.items())
+
+        declared = set()
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append("# TYPE {} {}".format(name, kind))
+
+        # Counter families are declared without the `_total` suffix of their samples
+        for (name, labels), value in counters:
+            declare(prefix + name, "counter")
+            lines.append("{}{} {}".format(prefix + name + "_total", _format_labels(labels), value))
+
+        for (name, labels), (bucket_counts, total, count) in histograms:
+            declare(prefix + name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS.get(name, _DEFAULT_BUCKETS), bucket_counts):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(prefix + name, _format_labels(labels, 'le="{}"'.format(bound)), cumulative))
+            lines.append("{}_bucket{} {}".format(prefix + name, _format_labels(labels, 'le="+Inf"'), count))
+            lines.append("{}_sum{} {}".format(prefix + name, _format_labels(labels), total))
+            lines.append("{}_count{} {}".format(prefix + name, _format_labels(labels), count))
+
+        for collector in self._collectors:
+            for name, kind, value in collector():
+                declare(prefix + name, kind)
+                lines.append("{}{} {}".format(prefix + name, "_total" if kind == "counter" else "", value))
+
+        return "\n".join(lines) + "\n"
@@ -1,10 +1,15 @@
 from flask import Flask, Response, request, send_file, render_template
 from flask_cors import CORS
-from .encode import Encoder
+from .encode import Encoder, IMAGE_FORMATS, COMPRESS_LEVEL, parse_compress_level, to_bytes
 from .decode import Decoder
-from io import BytesIO
-from PIL import Image
-from base64 import b64encode, b64decode
+from .cache import EncodeCache
+from .metrics import Metrics
+from .strategy import DecodeStrategy
+from .ingest import PayloadTooLarge, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, open_image, spool, read_chunks
+from .archive import ARCHIVES, MAX_BATCH_SIZE, read_jsonl, entry_name, result_fields
+from qrcode.exceptions import DataOverflowError
+from werkzeug.exceptions import RequestEntityTooLarge
+from base64 import b64encode
 import os
 import json
 import urllib.request
@@ -14,6 +19,32 @@ absolute_directory = __file__.replace(f"{sep}server.py", "")
 app = Flask("ChromaQR", template_folder=f"{absolute_directory}{sep}templates")
 CORS(app)
 
+# Request bodies are limited to the largest image plus some room for the rest of the form, and images sent as data URIs in
+# the `url` field are base64-encoded, so the form fields need a third more. Larger uploads are spooled to disk by Werkzeug.
+app.config["MAX_CONTENT_LENGTH"] = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+app.config["MAX_FORM_MEMORY_SIZE"] = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+
+# Cache of encoded PNGs, so popular payloads are only encoded once.
+# The size limit in bytes can be changed with the `CHROMAQR_CACHE_BYTES` environment variable.
+encode_cache = EncodeCache(max_bytes=int(os.environ.get("CHROMAQR_CACHE_BYTES", 64 * 1024 * 1024)))
+
+# Timings, failure counts and image sizes from every encode and decode, served in the Prometheus format at `/metrics`.
+metrics = Metrics()
+metrics.add_collector(lambda: [
+    ("encode_cache_hits", "counter", encode_cache.hits),
+    ("encode_cache_misses", "counter", encode_cache.misses),
+    ("encode_cache_bytes", "gauge", encode_cache.size),
+    ("encode_cache_entries", "gauge", len(encode_cache))
+])
+
+# Ladder of decoding attempts shared by every request, so what worked for recent photos is tried first.
+# Each image gets at most a second before the remaining rungs are skipped.
+strategy = DecodeStrategy(time_budget=1.0)
+
+# Timeout on images fetched by `/decode`, so a slow URL cannot hold up a worker indefinitely.
+# Their size is limited by `MAX_IMAGE_BYTES`, and images with more than `MAX_IMAGE_PIXELS` pixels are rejected before they are decoded.
+FETCH_TIMEOUT = 10
+
 @app.route("/")
 def home():
     return render_template("home.html")
@@ -30,21 +61,26 @@ def realtime():
 def logo():
     return send_file(f"{absolute_directory}{sep}..{sep}tests{sep}images{sep}generated.png")
 
+def _encode_error(message: str, status: int = 400) -> Response:
+    return Response(json.dumps({
+        "method": "encode",
+        "success": False,
+        "error": message
+    }), status=status, mimetype="application/json")
+
 @app.route("/encode", methods=["POST"])
 def encode():
     """
     Encoding endpoint for the API.
     Takes one parameter, `data`, to encode.
+    Binary data can instead be sent as the raw body of an `application/octet-stream` request, with the other parameters in the query string.
     """
 
-    form = request.form.to_dict()
+    raw = request.mimetype == "application/octet-stream"
+    form = request.args.to_dict() if raw else request.form.to_dict()
 
-    if "data" not in form.keys():
-        return Response(json.dumps({
-            "method": "encode",
-            "success": False,
-            "error": "please specify the data parameter containing the string to encode"
-        }), status=400, mimetype="application/json")
+    if not raw and "data" not in form.keys():
+        return _encode_error("please specify the data parameter containing the string to encode")
 
     if "format" not in form.keys():
         result_mode = "json"
@@ -56,53 +92,131 @@ def encode():
     elif form["errorCorrection"] in ["LOW", "MED", "HIGH", "MAX"]:
         error_correction = form["errorCorrection"]
     else:
-        return Response(json.dumps({
-            "method": "encode",
-            "success": False,
-            "error": "invalid error correction value, valid values are LOW, MED, HIGH and MAX"
-        }), status=400, mimetype="application/json")        
-
-    data = form["data"]
-    encoder = Encoder(error_correction=error_correction)
-    image = encoder.encode(data.encode("utf-8"))
-    
-    output_data = BytesIO()
-    image.save(output_data, "png")
-    b64 = b64encode(output_data.getvalue())
-    data_uri = u"data:image/png;base64,"+b64.decode("utf-8")
-
-    if result_mode == "json":
-        return Response(json.dumps({
+        return _encode_error("invalid error correction value, valid values are LOW, MED, HIGH and MAX")
+
+    if result_mode not in ["json", "image", "png", "webp"]:
+        return _encode_error("unknown format, accepted formats are 'json', 'image', 'png' and 'webp'")
+
+    try:
+        compress_level = parse_compress_level(form.get("compressLevel", COMPRESS_LEVEL))
+    except ValueError as e:
+        return _encode_error(str(e))
+
+    data = request.get_data() if raw else form["data"].encode("utf-8")
+    image_format = "webp" if result_mode == "webp" else "png"
+    cache_key = EncodeCache.key(data, error_correction, "{}:{}".format(image_format, compress_level))
+    cached = encode_cache.get(cache_key)
+
+    if cached is None:
+        # Palette images hold the same colours as RGB ones, and are several times faster to save as PNGs
+        encoder = Encoder(error_correction=error_correction, metrics=metrics, mode="P")
+        try:
+            image = encoder.encode(data)
+        except DataOverflowError:
+            return _encode_error("the data is too large to fit in a ChromaQR code")
+
+        cached = encode_cache.put(cache_key, to_bytes(image, image_format, compress_level))
+
+    # The JSON and image responses are different representations, so they need different entity tags
+    etag = cached.etag if result_mode != "json" else cached.etag + "-json"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif result_mode == "json":
+        b64 = b64encode(cached.data)
+        data_uri = u"data:image/png;base64,"+b64.decode("utf-8")
+
+        response = Response(json.dumps({
             "method": "encode",
             "success": True,
             "error_correction": error_correction,
             "result": data_uri
         }), mimetype="application/json")
-    elif result_mode == "image":
-        output_data.seek(0)
-        return send_file(output_data, mimetype="image/png", cache_timeout=0)
     else:
-        return Response(json.dumps({
-            "method": "encode",
-            "success": False,
-            "error": "unknown format, accepted formats are 'json' and 'image'"
-        }), status=400, mimetype="application/json")
+        response = Response(cached.data, mimetype=IMAGE_FORMATS[image_format])
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/encode-batch", methods=["POST"])
+def encode_batch():
+    """
+    Bulk encoding endpoint for the API.
+    Takes a batch of payloads as JSON lines, or as a multipart form with a file called `data` for each payload,
+    and streams back the codes in the same order as a zip file or a `multipart/mixed` body, one entry at a time.
+    """
+
+    params = request.args.to_dict()
+    params.update(request.form.to_dict())
+
+    error_correction = params.get("errorCorrection", "MED")
+    image_format = params.get("format", "png")
+    archive = params.get("archive", "zip")
+
+    if error_correction not in ["LOW", "MED", "HIGH", "MAX"]:
+        return _encode_error("invalid error correction value, valid values are LOW, MED, HIGH and MAX")
+    if image_format not in IMAGE_FORMATS:
+        return _encode_error("unknown format, accepted formats are 'png' and 'webp'")
+    if archive not in ARCHIVES:
+        return _encode_error("unknown archive, accepted archives are 'zip' and 'multipart'")
+
+    try:
+        compress_level = parse_compress_level(params.get("compressLevel", COMPRESS_LEVEL))
+    except ValueError as e:
+        return _encode_error(str(e))
+
+    try:
+        if request.mimetype == "multipart/form-data":
+            items = [(file.filename, file.read()) for file in request.files.getlist("data")]
+        else:
+            items = read_jsonl(request.get_data())
+    except ValueError:
+        items = []
 
+    if len(items) == 0:
+        return _encode_error("no payloads were recognised in your request, either send JSON lines with a data field on each line or upload a file called 'data' for each payload")
+    if len(items) > MAX_BATCH_SIZE:
+        return _encode_error("the batch is too large, the limit is {} payloads".format(MAX_BATCH_SIZE), status=413)
+
+    encoder = Encoder(error_correction=error_correction, metrics=metrics, mode="P")
+    writer = ARCHIVES[archive]()
+
+    def generate():
+        for index, (name, data) in enumerate(items):
+            try:
+                image = encoder.encode(data)
+            except DataOverflowError:
+                # The status has already been sent, so a payload which does not fit is reported in its own entry
+                yield writer.add(entry_name(name, index, "error.txt"), "text/plain", b"the data is too large to fit in a ChromaQR code")
+                continue
+
+            yield writer.add(entry_name(name, index, image_format), IMAGE_FORMATS[image_format], to_bytes(image, image_format, compress_level))
+        yield writer.close()
+
+    return Response(generate(), content_type=writer.content_type)
 
 @app.route("/decode", methods=["POST"])
 def decode():
     """
     Decoding endpoint for the API.
     Takes a file upload called `image` or a URL pointing to an image called `url`.
+    If `multiple` is `true`, every code in the image is decoded and returned in `results`.
     """
 
     try:
         if "url" in request.form.to_dict().keys():
-            response = urllib.request.urlopen(request.form.to_dict()["url"])
-            image = Image.open(BytesIO(response.read()))
+            response = urllib.request.urlopen(request.form.to_dict()["url"], timeout=FETCH_TIMEOUT)
+            image = open_image(spool(read_chunks(response), MAX_IMAGE_BYTES))
         else:    
             file = request.files["image"]
-            image = Image.open(file.stream)
+            image = open_image(file.stream)
+    except (PayloadTooLarge, RequestEntityTooLarge):
+        return Response(json.dumps({
+            "method": "decode",
+            "success": False,
+            "error": "the image is too large, the limits are {} bytes and {} pixels".format(MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS)
+        }), status=413, mimetype="application/json")
     except:
         return Response(json.dumps({
             "method": "decode",
@@ -110,16 +224,30 @@ def decode():
             "error": "no image file was recognised in your request, either upload a file with the identifier 'image' or submit a URL called 'url'"
         }), status=400, mimetype="application/json")
 
-    decoder = Decoder()
-    result = decoder.decode(image).decode("utf-8")
+    decoder = Decoder(metrics=metrics, strategy=strategy)
+
+    if request.form.get("multiple") == "true":
+        codes = decoder.decode_all(image)
+        if not codes:
+            return Response(json.dumps({
+                "method": "decode",
+                "success": False,
+                "error": "no ChromaQR code was found in the uploaded image"
+            }), status=404, mimetype="application/json")
 
-    if result != "":
         return Response(json.dumps({
             "method": "decode",
             "success": True,
-            "result": result,
-            "coordinates": decoder.code_quad
+            "results": [dict(result_fields(code.result), coordinates=code.coordinates) for code in codes]
         }), mimetype="application/json")
+
+    result = decoder.decode(image)
+
+    if result != b"":
+        response = {"method": "decode", "success": True}
+        response.update(result_fields(result))
+        response["coordinates"] = decoder.code_quad
+        return Response(json.dumps(response), mimetype="application/json")
     else:
         return Response(json.dumps({
             "method": "decode",
@@ -127,5 +255,11 @@ def decode():
             "error": "no ChromaQR code was found in the uploaded image"
         }), status=404, mimetype="application/json")
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Metrics endpoint in the Prometheus text format."""
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 def run(host="0.0.0.0", port=8000):
     app.run(host, port)
\ No newline at end of file
@@ -0,0 +1,37 @@
+import glob
+import os
+import tarfile
+import zipfile
+
+def iter_sources(spec: str):
+    """
+    Stream the images described by `spec`, which can be a directory, a glob pattern, or a tar or zip archive.
+    Yields `(name, source)` pairs, where `source` is either a file path or the bytes of an archive member.
+    Archive members are read one at a time so the whole archive is never held in memory.
+    """
+
+    if os.path.isdir(spec):
+        for entry in sorted(os.listdir(spec)):
+            path = os.path.join(spec, entry)
+            if os.path.isfile(path):
+                yield entry, path
+
+    elif os.path.isfile(spec) and zipfile.is_zipfile(spec):
+        with zipfile.ZipFile(spec) as archive:
+            for member in archive.infolist():
+                if not member.is_dir():
+                    yield member.filename, archive.read(member)
+
+    elif os.path.isfile(spec) and tarfile.is_tarfile(spec):
+        with tarfile.open(spec, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member).read()
+
+    elif os.path.isfile(spec):
+        yield os.path.basename(spec), spec
+
+    else:
+        for path in sorted(glob.iglob(spec, recursive=True)):
+            if os.path.isfile(path):
+                yield path, path
@@ -0,0 +1,69 @@
+from collections import namedtuple
+from threading import Lock
+
+# One attempt at decoding an image: the largest side in pixels it is scaled down to,
+# how the channels are thresholded (`fixed`, `otsu` or `adaptive`),
+# and how the colours are separated into channels first (`rgb`, `white_balance`, or `unmix` to undo crosstalk between the channels).
+Rung = namedtuple("Rung", "scale threshold separation")
+
+THRESHOLDS = ("fixed", "otsu", "adaptive")
+SEPARATIONS = ("rgb", "white_balance", "unmix")
+
+# The single attempt made when no strategy is given, with a fixed threshold at up to 1280 pixels.
+BASIC = [Rung(1280, "fixed", "rgb")]
+
+# Ladder for photos with colour casts, crosstalk between channels or uneven lighting, starting with the basic attempt.
+LADDER = [
+    Rung(1280, "fixed", "rgb"),
+    Rung(1280, "fixed", "unmix"),
+    Rung(1280, "fixed", "white_balance"),
+    Rung(1280, "otsu", "white_balance"),
+    Rung(1280, "adaptive", "rgb"),
+    Rung(640, "adaptive", "white_balance"),
+    Rung(640, "otsu", "rgb")
+]
+
+class DecodeStrategy:
+    """
+    Ordered ladder of decoding attempts, which a `Decoder` climbs until all three codes are found.
+    Initialised with a list of `Rung`s, defaulting to `LADDER`, and optionally a time budget in seconds for each image,
+    after which no more rungs are started. The first rung is always tried, however long it takes.
+
+    If `reorder` is `True`, rungs which succeeded recently are tried first. A strategy can be shared between decoders and threads,
+    so that what works for one image is tried first for the next.
+    """
+
+    def __init__(self, rungs: list = None, time_budget: float = None, reorder: bool = True):
+        self.rungs = [Rung(*rung) for rung in (LADDER if rungs is None else rungs)]
+        self.time_budget = time_budget
+        self.reorder = reorder
+
+        if len(self.rungs) == 0:
+            raise ValueError("a strategy needs at least one rung")
+        for rung in self.rungs:
+            if rung.threshold not in THRESHOLDS or rung.separation not in SEPARATIONS or rung.scale <= 0:
+                raise ValueError("invalid rung {}".format(rung))
+
+        self._scores = [0.0] * len(self.rungs)
+        self._lock = Lock()
+
+    @property
+    def max_scale(self) -> int:
+        return max(rung.scale for rung in self.rungs)
+
+    def order(self) -> list:
+        """Return the rungs in the order they should be tried, with ties kept in their configured order."""
+
+        if not self.reorder:
+            return list(self.rungs)
+
+        with self._lock:
+            ranking = sorted(range(len(self.rungs)), key=lambda i: -self._scores[i])
+        return [self.rungs[i] for i in ranking]
+
+    def record(self, rung: Rung):
+        """Record that a rung decoded an image, so that it is tried earlier next time. Older successes count for less."""
+
+        with self._lock:
+            self._scores = [score * 0.9 for score in self._scores]
+            self._scores[self.rungs.index(rung)] += 1
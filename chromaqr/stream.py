@@ -0,0 +1,149 @@
+from PIL import Image
+from .encode import Encoder
+from .capacity import max_payload
+import os
+import struct
+import zlib
+
+# Header at the start of every frame: magic bytes, stream ID, frame index, total number of frames and CRC-32 of the frame's data.
+FRAME_HEADER = struct.Struct(">2sIIII")
+FRAME_MAGIC = b"CQ"
+
+class StreamEncoder:
+    """
+    Encoder for payloads too large for a single ChromaQR code.
+    Initialised by defining the error correction level and optionally the number of payload bytes in each frame.
+    """
+
+    def __init__(self, error_correction = "MED", chunk_size = None):
+        self.encoder = Encoder(error_correction=error_correction)
+        maximum = max_payload(error_correction) - FRAME_HEADER.size
+
+        if chunk_size is None:
+            self.chunk_size = maximum
+        elif 0 < chunk_size <= maximum:
+            self.chunk_size = chunk_size
+        else:
+            raise ValueError("chunk size must be between 1 and {} bytes for this error correction level".format(maximum))
+
+    def encode(self, data, stream_id: int = None):
+        """
+        Encode a bytearray or a seekable binary file object into a sequence of ChromaQR codes.
+        Returns a generator of PIL Images, one for each frame.
+
+        File objects are read one chunk at a time, so the whole payload is never held in memory.
+        """
+
+        if isinstance(data, (bytes, bytearray)):
+            length = len(data)
+            read = lambda index: bytes(data[index * self.chunk_size : (index + 1) * self.chunk_size])
+        else:
+            start = data.tell()
+            length = data.seek(0, os.SEEK_END) - start
+            data.seek(start)
+            read = lambda index: data.read(self.chunk_size)
+
+        if stream_id is None:
+            stream_id = struct.unpack(">I", os.urandom(4))[0]
+
+        total = max(1, -(-length // self.chunk_size))
+        for index in range(total):
+            chunk = read(index)
+            header = FRAME_HEADER.pack(FRAME_MAGIC, stream_id, index, total, zlib.crc32(chunk))
+            yield self.encoder.encode(header + chunk)
+
+class StreamDecoder:
+    """
+    Incremental decoder for payloads split across a sequence of ChromaQR codes.
+    Frames can be added in any order, and `complete` becomes `True` once every frame has been received.
+
+    Frames are binary, so they can only be read when the decoder locates the module grid of their codes.
+    A decoder with `locate_once` set to `False` cannot read them.
+    """
+
+    def __init__(self, decoder = None):
+        # Imported here so that stream encoding never loads pyzbar
+        from .decode import Decoder
+
+        self.decoder = decoder if decoder is not None else Decoder()
+        self.stream_id = None
+        self.total = None
+        self.chunks = {}
+
+    @property
+    def complete(self) -> bool:
+        return self.total is not None and len(self.chunks) == self.total
+
+    @property
+    def missing(self) -> list:
+        """Indices of the frames which have not been received yet."""
+
+        if self.total is None:
+            return []
+        return [index for index in range(self.total) if index not in self.chunks]
+
+    def add_frame(self, image: Image) -> bool:
+        """
+        Decode a PIL Image containing one frame and add it to the stream.
+        Returns whether the stream is complete.
+
+        Raises `ValueError` if no ChromaQR code is found, the code is not a frame of this stream, or its checksum does not match,
+        or if the module grid of the code could not be located, since the binary data of the frame cannot be read reliably without it.
+        """
+
+        data = self.decoder.decode(image)
+        if data == b"":
+            raise ValueError("no ChromaQR code was found in the image")
+
+        try:
+            return self.add_data(data)
+        except ValueError:
+            if self.decoder.exact is False:
+                raise ValueError("the module grid of the code could not be located, and pyzbar cannot read the binary data of a frame without changing it")
+            raise
+
+    def add_data(self, data: bytes) -> bool:
+        """
+        Add the already decoded bytes of one frame to the stream.
+        Returns whether the stream is complete.
+        """
+
+        if len(data) < FRAME_HEADER.size:
+            raise ValueError("the code is too short to be a stream frame")
+
+        magic, stream_id, index, total, checksum = FRAME_HEADER.unpack(data[: FRAME_HEADER.size])
+        chunk = bytes(data[FRAME_HEADER.size :])
+
+        if magic != FRAME_MAGIC:
+            raise ValueError("the code is not a stream frame")
+        if self.stream_id is not None and (stream_id != self.stream_id or total != self.total):
+            raise ValueError("the frame belongs to a different stream")
+        if index >= total or zlib.crc32(chunk) != checksum:
+            raise ValueError("the frame is corrupted")
+
+        self.stream_id, self.total = stream_id, total
+        self.chunks.setdefault(index, chunk)
+        return self.complete
+
+    def result(self) -> bytes:
+        """
+        Return the reassembled payload.
+        Raises `ValueError` if any frames are missing.
+        """
+
+        if not self.complete:
+            raise ValueError("the stream is missing {} frames".format(len(self.missing) if self.total else "some"))
+
+        return b"".join(self.chunks[index] for index in range(self.total))
+
+    def write(self, file):
+        """
+        Write the reassembled payload to a binary file object without joining it in memory first.
+        Raises `ValueError` if any frames are missing.
+        """
+
+        if not self.complete:
+            raise ValueError("the stream is missing {} frames".format(len(self.missing) if self.total else "some"))
+
+        for index in range(self.total):
+            file.write(self.chunks[index])
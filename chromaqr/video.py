@@ -0,0 +1,102 @@
+from PIL import Image, ImageSequence
+from .decode import Decoder
+from .sources import iter_sources
+from collections import namedtuple
+from io import BytesIO
+import os
+import tarfile
+import zipfile
+
+# Number of frames in a row in which the code can be missed around its last position before the whole frame is searched again.
+FULL_SCAN_AFTER = 3
+
+# Result of decoding one frame with `VideoDecoder.decode_frames`.
+# `changed` is `True` if the payload differs from the previous frame's, including when the code first appears or is lost.
+FrameResult = namedtuple("FrameResult", "index result coordinates changed")
+
+def _fingerprint(frame: Image) -> bytes:
+    """
+    Sample every 16th pixel of a frame in each direction, which is enough to tell repeated frames apart from new ones.
+    The frame is shrunk before its pixels are copied out, so only the sampled pixels are ever converted.
+    """
+
+    width, height = frame.size
+    return frame.resize((max(width // 16, 1), max(height // 16, 1)), Image.NEAREST).tobytes()
+
+def iter_frames(spec: str):
+    """
+    Stream the frames described by `spec`, which can be an animated image such as a GIF, a video file,
+    or a directory, glob pattern, or tar or zip archive of images, in order.
+    Video files need `imageio` with an FFmpeg backend (`pip install chromaqr[video]`), and raise `ImportError` without it.
+    """
+
+    if os.path.isfile(spec) and not zipfile.is_zipfile(spec) and not tarfile.is_tarfile(spec):
+        try:
+            image = Image.open(spec)
+        except OSError:
+            # Not an image Pillow can open, so treat it as a video
+            import imageio.v3 as iio
+            for pixels in iio.imiter(spec):
+                yield Image.fromarray(pixels)
+            return
+
+        if getattr(image, "n_frames", 1) > 1:
+            for frame in ImageSequence.Iterator(image):
+                # Frames of an animation share one image, so each is copied before the next is read
+                yield frame.convert("RGBA" if frame.mode in ("P", "RGBA") else "RGB")
+        else:
+            yield image
+        return
+
+    for _, source in iter_sources(spec):
+        yield Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+
+class VideoDecoder:
+    """
+    Decoder for the frames of a video, or any other sequence of frames where the code moves little from one frame to the next.
+
+    Each frame is decoded with `Decoder.track`, which only looks at the area around where the code was in the previous frame.
+    The whole frame is only searched once the code has been missed there `full_scan_after` frames in a row,
+    so a few blurred frames do not each cost a full search. Frames in memory which repeat the previous one exactly are not decoded at all.
+    A `Decoder` can be given to set its options, and is otherwise created with the defaults.
+    """
+
+    def __init__(self, decoder: Decoder = None, full_scan_after: int = FULL_SCAN_AFTER):
+        self.decoder = decoder if decoder is not None else Decoder()
+        self.full_scan_after = full_scan_after
+        self.misses = 0
+        self.result = b""
+        self._fingerprint = None
+
+    @property
+    def code_quad(self) -> list:
+        """Corners of the code in the last frame it was found in, relative to the frame downscaled to the largest scale of the decoder's strategy."""
+
+        return self.decoder.code_quad
+
+    def decode(self, frame: Image) -> bytes:
+        """Decode the next frame, returning the payload of its code, which is empty if no code was found."""
+
+        # Frames opened lazily from files are left for the decoder to load, so that large JPEGs can still be reduced as they are decoded
+        fingerprint = _fingerprint(frame) if not getattr(frame, "tile", None) else None
+        if fingerprint is not None and fingerprint == self._fingerprint:
+            if self.decoder.metrics is not None:
+                self.decoder.metrics.count("repeated_frames")
+            return self.result
+        self._fingerprint = fingerprint
+
+        self.result = self.decoder.track(frame, widen=self.misses >= self.full_scan_after)
+        self.misses = 0 if self.result != b"" else self.misses + 1
+        return self.result
+
+    def decode_frames(self, frames):
+        """
+        Decode a sequence of frames, such as the output of `iter_frames`, returning a generator of `FrameResult` tuples.
+        Check `changed` to only act on a payload once, rather than once for every frame it is visible in.
+        """
+
+        previous = b""
+        for index, frame in enumerate(frames):
+            result = self.decode(frame)
+            yield FrameResult(index, result, self.code_quad if result != b"" else None, result != previous)
+            previous = result
@@ -19,13 +19,16 @@ setup(
         "colorama",
         "qrcode",
         "pillow",
+        "numpy",
         "flask",
         "flask-cors"
     ],
     extras_require={
         "tests": ["pytest"],
+        "async": ["aiohttp"],
+        "video": ["imageio[ffmpeg]"],
     },
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
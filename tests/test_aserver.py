@@ -0,0 +1,168 @@
+import pytest
+import asyncio
+import zipfile
+from base64 import b64encode, b64decode
+from io import BytesIO
+from PIL import Image
+
+aiohttp = pytest.importorskip("aiohttp")
+
+import chromaqr
+import chromaqr.aserver
+from aiohttp.test_utils import TestClient, TestServer
+
+def with_client(test, **options):
+    """Run an asynchronous test against a fresh instance of the async server."""
+
+    async def run():
+        async with TestClient(TestServer(chromaqr.aserver.create_app(workers=1, **options))) as client:
+            await test(client)
+
+    asyncio.run(run())
+
+def test_aserver_encode_success():
+    """Test case for a successful encode in a worker process."""
+
+    async def test(client):
+        response = await client.post("/encode", data={"data": "Hello from ChromaQR!"})
+        response_json = await response.json()
+
+        assert response.status == 200
+        assert list(response_json.keys()) == ["method", "success", "error_correction", "result"]
+        assert response_json["result"].startswith("data:image/png;base64,")
+
+        response = await client.post("/encode", data={"data": "Hello from ChromaQR!"}, headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status == 304
+
+    with_client(test)
+
+def test_aserver_encode_batch():
+    """Test case for a batch of payloads encoded in worker processes and streamed back as a zip file."""
+
+    async def test(client):
+        request = "\n".join('{{"data": "payload {}"}}'.format(i) for i in range(3))
+        response = await client.post("/encode-batch?format=webp", data=request, headers={"Content-Type": "application/x-ndjson"})
+
+        assert response.status == 200
+        assert response.content_type == "application/zip"
+
+        with zipfile.ZipFile(BytesIO(await response.read())) as archive:
+            assert archive.namelist() == ["0.webp", "1.webp", "2.webp"]
+            assert chromaqr.Decoder().decode(Image.open(archive.open("2.webp"))) == b"payload 2"
+
+    with_client(test)
+
+def test_aserver_decode_success():
+    """Test case for a successful decode of an upload in a worker process."""
+
+    async def test(client):
+        with open("tests/images/generated.png", "rb") as imageFile:
+            form = aiohttp.FormData()
+            form.add_field("image", imageFile.read(), filename="generated.png")
+
+        response = await client.post("/decode", data=form)
+        response_json = await response.json()
+
+        assert response.status == 200
+        assert response_json["result"] == "Hello from ChromaQR!"
+        assert response_json["coordinates"] == [[40, 40], [40, 250], [250, 250], [250, 40]]
+
+    with_client(test)
+
+def test_aserver_decode_uri():
+    """Test case for a successful decode from a data URI."""
+
+    async def test(client):
+        with open("tests/images/generated.png", "rb") as imageFile:
+            url = "data:image/png;base64," + b64encode(imageFile.read()).decode("ascii")
+
+        response = await client.post("/decode", data={"url": url})
+        response_json = await response.json()
+
+        assert response.status == 200
+        assert response_json["result"] == "Hello from ChromaQR!"
+
+    with_client(test)
+
+def test_aserver_decode_binary():
+    """Test case for decoding binary data, which is returned base64-encoded."""
+
+    async def test(client):
+        data = bytes(range(256))
+        response = await client.post("/encode?format=png", data=data, headers={"Content-Type": "application/octet-stream"})
+
+        form = aiohttp.FormData()
+        form.add_field("image", await response.read(), filename="binary.png")
+        response = await client.post("/decode", data=form)
+        response_json = await response.json()
+
+        assert response.status == 200
+        assert response_json["encoding"] == "base64"
+        assert b64decode(response_json["result"]) == data
+
+    with_client(test)
+
+def test_aserver_decode_too_large():
+    """Test case for rejecting an image larger than the fetch limit."""
+
+    async def test(client):
+        url = "data:image/png;base64," + b64encode(bytes(1024)).decode("ascii")
+
+        response = await client.post("/decode", data={"url": url})
+        response_json = await response.json()
+
+        assert response.status == 413
+        assert response_json["success"] == False
+
+    with_client(test, max_fetch_bytes=512)
+
+def test_aserver_decode_too_many_pixels():
+    """Test case for rejecting an image with more pixels than the limit before it reaches a worker."""
+
+    async def test(client):
+        with open("tests/images/generated.png", "rb") as imageFile:
+            form = aiohttp.FormData()
+            form.add_field("image", imageFile.read(), filename="generated.png")
+
+        response = await client.post("/decode", data=form)
+        assert response.status == 413
+
+    with_client(test, max_pixels=1000)
+
+def test_aserver_busy():
+    """Test case for shedding load once the worker pool is full."""
+
+    async def test(client):
+        pool = client.server.app[chromaqr.aserver.POOL]
+        pool.pending = pool.limit
+
+        response = await client.post("/decode", data={"url": "https://example.com/image.png"})
+        assert response.status == 503
+        assert response.headers["Retry-After"] == "1"
+
+        pool.pending = 0
+
+    with_client(test, backlog=0)
+
+def test_aserver_stream():
+    """Test case for decoding image file and raw frames sent over a WebSocket."""
+
+    async def test(client):
+        with open("tests/images/generated.png", "rb") as imageFile:
+            image_bytes = imageFile.read()
+
+        image = Image.open(BytesIO(image_bytes))
+        flattened = Image.new("RGB", image.size, "white")
+        flattened.paste(image, mask=image.split()[3])
+        raw_frame = chromaqr.aserver.RAW_FRAME_HEADER.pack(b"RGB ", *flattened.size) + flattened.tobytes()
+
+        async with client.ws_connect("/stream") as socket:
+            for frame in (image_bytes, raw_frame):
+                await socket.send_bytes(frame)
+                response_json = await socket.receive_json()
+
+                assert response_json["success"] == True
+                assert response_json["result"] == "Hello from ChromaQR!"
+                assert response_json["coordinates"] == [[40, 40], [40, 250], [250, 250], [250, 40]]
+
+    with_client(test)
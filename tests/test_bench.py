@@ -0,0 +1,23 @@
+from chromaqr.bench import run, compare
+
+def test_bench_run():
+    """Test case for a minimal benchmark run."""
+
+    report = run(sizes=[16, None], levels=["MAX"], variants=["clean", "jpeg"], resolutions=[None], repeat=2)
+    results = report["results"]
+
+    assert [result["operation"] for result in results] == ["encode", "decode", "decode", "encode", "decode", "decode"]
+    assert results[3]["payload_bytes"] == 3819
+    assert results[1]["success_rate"] == 1.0
+    assert set(results[0]["stages_ms"]) == {"codewords", "modules", "render"}
+    assert set(results[1]["stages_ms"]) == {"load", "flatten", "binarize", "zbar", "grid"}
+
+def test_bench_compare():
+    """Test case for finding regressions against a baseline report."""
+
+    baseline = run(sizes=[16], levels=["LOW"], variants=["clean"], resolutions=[None], repeat=1)
+    report = run(sizes=[16], levels=["LOW"], variants=["clean"], resolutions=[None], repeat=1)
+    report["results"][0]["p50_ms"] = baseline["results"][0]["p50_ms"] * 2
+    report["results"][1]["p50_ms"] = baseline["results"][1]["p50_ms"]
+
+    assert compare(baseline, report) == [(baseline["results"][0], report["results"][0])]
@@ -0,0 +1,86 @@
+import chromaqr
+from chromaqr.bitstream import decode_modules
+from chromaqr.grid import locate_grid, sample_grid
+from chromaqr.decode import _binarize, _to_array
+from chromaqr.layout import encode_codewords, build_modules, _penalties
+from qrcode import QRCode, constants, util
+from PIL import Image
+import numpy as np
+
+def test_decode_modules():
+    """Test case for decoding module matrices generated by the qrcode library."""
+
+    for version, data in [(1, b"Hello"), (7, b"0123456789" * 10), (25, bytes(range(256)) * 3)]:
+        qr_code = QRCode(version=version, error_correction=constants.ERROR_CORRECT_M)
+        qr_code.add_data(data)
+        qr_code.make(fit=False)
+
+        assert decode_modules(np.array(qr_code.modules, dtype=bool)) == data
+
+def test_decode_modules_with_errors():
+    """Test case for decoding a module matrix with some damaged modules."""
+
+    qr_code = QRCode(version=5, error_correction=constants.ERROR_CORRECT_H)
+    qr_code.add_data(b"Hello from ChromaQR!")
+    qr_code.make(fit=False)
+
+    modules = np.array(qr_code.modules, dtype=bool)
+    modules[20:24, 20:24] = ~modules[20:24, 20:24]
+
+    assert decode_modules(modules) == b"Hello from ChromaQR!"
+
+def test_sample_grid():
+    """Test case for reading all three channels from the grid of the red code."""
+
+    planes = _binarize(_to_array(Image.open("tests/images/generated.png")))
+    grid = locate_grid(planes[0], [[40, 40], [40, 250], [250, 250], [250, 40]])
+
+    assert grid.size == 21
+    assert b"".join(decode_modules(sample_grid(plane, grid)) for plane in planes) == b"Hello from ChromaQR!"
+
+def test_decode_without_locate_once():
+    """Test case for decoding by searching for each of the three codes separately."""
+
+    decoder = chromaqr.Decoder(locate_once=False)
+    assert decoder.decode(Image.open("tests/images/generated.png")) == b"Hello from ChromaQR!"
+
+def test_encode_codewords():
+    """Test case for encoding codewords identically to the qrcode library."""
+
+    for version, level, error_correction in [(2, "L", constants.ERROR_CORRECT_L), (12, "Q", constants.ERROR_CORRECT_Q), (30, "H", constants.ERROR_CORRECT_H)]:
+        segments = [util.QRData(b"Hello from ChromaQR!"), util.QRData(b"0123456789")]
+        assert encode_codewords(segments, version, level).tolist() == util.create_data(version, error_correction, segments)
+
+def test_build_modules():
+    """Test case for laying out codewords which can be read back."""
+
+    segments = [util.QRData(b"Hello from ChromaQR!")]
+    modules = build_modules([encode_codewords(segments, 8, "M")], 8, "M")[0]
+
+    assert modules.shape == (49, 49)
+    assert decode_modules(modules) == b"Hello from ChromaQR!"
+
+def test_mask_penalties():
+    """Test case for scoring and choosing masks identically to the qrcode library."""
+
+    qr_code = QRCode(version=2, error_correction=constants.ERROR_CORRECT_M)
+    qr_code.add_data(b"Hello from ChromaQR!")
+
+    candidates = []
+    for mask in range(8):
+        qr_code.makeImpl(False, mask)
+        candidates.append(np.array(qr_code.modules, dtype=bool))
+
+    assert _penalties(np.stack(candidates)).tolist() == [471, 521, 438, 626, 475, 449, 512, 742]
+    assert [util.lost_point(candidate.tolist()) for candidate in candidates] == [471, 521, 438, 626, 475, 449, 512, 742]
+
+    # qrcode scores masks with the format information left light, which chooses mask 5 rather than mask 2 here
+    qr_code.make(fit=False)
+    modules = build_modules([encode_codewords(qr_code.data_list, 2, "M")], 2, "M")[0]
+    assert (modules == np.array(qr_code.modules, dtype=bool)).all()
+
+    qr_code = QRCode(version=9, error_correction=constants.ERROR_CORRECT_M)
+    qr_code.add_data(bytes(range(150)))
+    qr_code.make(fit=False)
+    modules = build_modules([encode_codewords(qr_code.data_list, 9, "M")], 9, "M")[0]
+    assert (modules == np.array(qr_code.modules, dtype=bool)).all()
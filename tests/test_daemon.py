@@ -0,0 +1,88 @@
+import chromaqr
+import chromaqr.daemon
+import chromaqr.cli
+import pytest
+import socket
+import tempfile
+import threading
+import os
+from io import BytesIO
+from PIL import Image
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix domain sockets are not available")
+
+@pytest.fixture
+def daemon_path():
+    path = os.path.join(tempfile.mkdtemp(), "chromaqr.sock")
+    server = chromaqr.daemon.create_server(path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield path
+
+    server.shutdown()
+    server.server_close()
+    os.remove(path)
+
+def test_daemon_encode_decode(daemon_path):
+    """Test case for encoding and decoding with a running daemon."""
+
+    assert chromaqr.daemon.is_running(daemon_path)
+
+    png = chromaqr.daemon.encode(b"Hello from ChromaQR!", "HIGH", path=daemon_path)
+    expected = chromaqr.Encoder(error_correction="HIGH").encode(b"Hello from ChromaQR!")
+    assert Image.open(BytesIO(png)).tobytes() == expected.tobytes()
+
+    assert chromaqr.daemon.decode(png, path=daemon_path) == b"Hello from ChromaQR!"
+
+    with pytest.raises(chromaqr.daemon.DaemonError):
+        chromaqr.daemon.decode(b"not an image", path=daemon_path)
+
+def test_daemon_cli_encode(daemon_path, tmp_path, monkeypatch):
+    """Test case for the CLI only handing PNG outputs and options which fit in a request to the daemon."""
+
+    with pytest.raises(ValueError):
+        chromaqr.daemon.encode(b"Hello from ChromaQR!", box_size=70000, path=daemon_path)
+
+    for name, expected in (("code.png", "PNG"), ("code.bmp", "BMP")):
+        monkeypatch.setattr("sys.argv", ["chromaqr", "encode", "--text", "Hello from ChromaQR!", "--outFile", str(tmp_path / name), "--socket", daemon_path])
+        chromaqr.cli.main()
+
+        assert Image.open(str(tmp_path / name)).format == expected
+
+def test_daemon_not_running():
+    """Test case for the client when no daemon is listening."""
+
+    path = os.path.join(tempfile.mkdtemp(), "missing.sock")
+
+    assert not chromaqr.daemon.is_running(path)
+    with pytest.raises(OSError):
+        chromaqr.daemon.encode(b"Hello from ChromaQR!", path=path)
+
+def test_daemon_other_user(daemon_path, tmp_path, monkeypatch):
+    """Test case for never using or replacing a socket which belongs to another user."""
+
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+
+    assert not chromaqr.daemon.is_running(daemon_path)
+    with pytest.raises(PermissionError):
+        chromaqr.daemon.encode(b"Hello from ChromaQR!", path=daemon_path)
+    with pytest.raises(PermissionError):
+        chromaqr.daemon.create_server(daemon_path)
+    assert os.path.exists(daemon_path)
+
+    # The CLI encodes in its own process instead
+    monkeypatch.setattr("sys.argv", ["chromaqr", "encode", "--text", "Hello from ChromaQR!", "--outFile", str(tmp_path / "code.png"), "--socket", daemon_path])
+    chromaqr.cli.main()
+    assert chromaqr.Decoder().decode(Image.open(str(tmp_path / "code.png"))) == b"Hello from ChromaQR!"
+
+def test_daemon_socket_path(monkeypatch):
+    """Test case for the default socket being somewhere only the user can open."""
+
+    monkeypatch.delenv("CHROMAQR_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert chromaqr.daemon.default_socket_path() == "/run/user/1000/chromaqr.sock"
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert chromaqr.daemon.default_socket_path() == os.path.join(tempfile.gettempdir(), "chromaqr-{}".format(os.getuid()), "daemon.sock")
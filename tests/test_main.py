@@ -1,5 +1,11 @@
 import chromaqr
 from PIL import Image
+from io import BytesIO
+import numpy as np
+import pytest
+import chromaqr.ingest
+import chromaqr.cli
+from base64 import b64decode
 
 def test_generated_decode():
     decoder = chromaqr.Decoder()
@@ -18,4 +24,255 @@ def test_encode_decode():
     encoded = encoder.encode(stringToEncode)
     decoded = decoder.decode(encoded)
 
-    assert decoded == stringToEncode
\ No newline at end of file
+    assert decoded == stringToEncode
+
+def test_encode_many():
+    encoder = chromaqr.Encoder()
+    decoder = chromaqr.Decoder()
+
+    stringsToEncode = [b"Hello from ChromaQR!", b"0123456789", b"Hello from ChromaQR!"]
+
+    for encoded, stringToEncode in zip(encoder.encode_many(stringsToEncode), stringsToEncode):
+        assert decoder.decode(encoded) == stringToEncode
+
+def test_decode_many():
+    decoder = chromaqr.Decoder()
+
+    with open("tests/images/generated.png", "rb") as f:
+        imageBytes = f.read()
+
+    sources = ["tests/images/generated.png", imageBytes, "tests/images/empty_image.png"]
+    results = list(decoder.decode_many(sources, workers=2))
+
+    assert [result.index for result in results] == [0, 1, 2]
+    assert [result.result for result in results] == [b"Hello from ChromaQR!", b"Hello from ChromaQR!", b""]
+
+def test_cli_decode_binary(tmp_path, monkeypatch, capsys):
+    data = bytes(range(256))
+    chromaqr.Encoder().encode(data).save(str(tmp_path / "binary.png"))
+
+    monkeypatch.setattr("sys.argv", ["chromaqr", "decode", "--inFile", str(tmp_path / "binary.png"), "--noDaemon"])
+    chromaqr.cli.main()
+
+    assert b64decode(capsys.readouterr().out.strip()) == data
+
+def test_decode_all():
+    encoder = chromaqr.Encoder()
+    decoder = chromaqr.Decoder()
+
+    stringsToEncode = [b"Hello from ChromaQR!", b"0123456789", b"https://example.com", b"ChromaQR"]
+    sheet = Image.new("RGB", (900, 900), "white")
+    for i, stringToEncode in enumerate(stringsToEncode):
+        sheet.paste(encoder.encode(stringToEncode), (450 * (i % 2), 450 * (i // 2)))
+
+    for workers in (1, 2):
+        codes = decoder.decode_all(sheet.copy(), workers=workers)
+        assert [code.result for code in codes] == stringsToEncode
+        assert codes[3].coordinates[0] == [490, 490]
+
+    assert decoder.decode_all(Image.open("tests/images/empty_image.png")) == []
+
+def test_stream_encode_decode():
+    encoder = chromaqr.StreamEncoder(chunk_size=500)
+    decoder = chromaqr.StreamDecoder()
+
+    bytesToEncode = bytes(range(256)) * 6
+
+    frames = list(encoder.encode(bytesToEncode))
+    assert len(frames) == 4
+
+    for frame in reversed(frames):
+        complete = decoder.add_frame(frame)
+
+    assert complete
+    assert decoder.result() == bytesToEncode
+
+class TextDecoder(chromaqr.Decoder):
+    """Decoder which converts what it reads like pyzbar does, as if the module grid could not be located."""
+
+    def decode(self, image):
+        result = super().decode(image)
+        self.exact = False
+        return result.decode("latin-1").encode("utf-8")
+
+def test_stream_decode_inexact():
+    frame = next(chromaqr.StreamEncoder().encode(bytes(range(256))))
+
+    decoder = chromaqr.Decoder()
+    assert chromaqr.StreamDecoder(decoder).add_frame(frame)
+    assert decoder.exact == True
+
+    with pytest.raises(ValueError, match="module grid"):
+        chromaqr.StreamDecoder(TextDecoder()).add_frame(frame)
+
+def test_track():
+    decoder = chromaqr.Decoder()
+    frame = Image.new("RGB", (640, 480), "white")
+    code = Image.open("tests/images/generated.png")
+    frame.paste(code, (100, 80), mask=code.split()[3])
+
+    assert decoder.track(frame.copy()) == b"Hello from ChromaQR!"
+    assert decoder.code_quad == [[140, 120], [140, 330], [350, 330], [350, 120]]
+    assert decoder.track(frame.copy()) == b"Hello from ChromaQR!"
+
+    assert decoder.track(Image.new("RGB", (640, 480), "white")) == b""
+    assert decoder.code_quad == None
+
+    # Nothing is reported as exact until a grid has actually been read
+    decoder.track(frame.copy())
+    decoder.exact = None
+    assert decoder.track(Image.new("RGB", (640, 480), "white"), widen=False) == b""
+    assert decoder.exact == None
+    assert decoder.track(frame.copy()) == b"Hello from ChromaQR!"
+    assert decoder.exact == True
+
+def test_track_strategy_scale():
+    code = Image.open("tests/images/generated.png")
+    frame = Image.new("RGB", (1280, 960), "white")
+    frame.paste(code, (200, 160), mask=code.split()[3])
+
+    decoder = chromaqr.Decoder(strategy=chromaqr.DecodeStrategy([chromaqr.Rung(640, "fixed", "rgb")]))
+    assert decoder.decode(frame.copy()) == b"Hello from ChromaQR!"
+    expected = decoder.code_quad
+
+    # Both the first search of the whole frame and the search around the previous corners use the scale of the strategy
+    decoder.code_quad = None
+    assert decoder.track(frame.copy()) == b"Hello from ChromaQR!"
+    assert decoder.code_quad == expected
+    assert decoder.track(frame.copy(), widen=False) == b"Hello from ChromaQR!"
+    assert decoder.code_quad == expected
+
+def test_video_decode():
+    metrics = chromaqr.Metrics()
+    decoder = chromaqr.VideoDecoder(chromaqr.Decoder(metrics=metrics), full_scan_after=2)
+    code = Image.open("tests/images/generated.png")
+
+    frames = []
+    for i in range(4):
+        frame = Image.new("RGB", (640, 480), "white")
+        frame.paste(code, (100 + i * 4, 80 + i * 2), mask=code.split()[3])
+        frames.append(frame)
+    frames.insert(2, frames[1].copy())
+    frames += [Image.new("RGB", (640, 480), (255, 255, 255 - i)) for i in range(3)]
+
+    results = list(decoder.decode_frames(frames))
+
+    assert [result.result for result in results] == [b"Hello from ChromaQR!"] * 5 + [b""] * 3
+    assert [result.changed for result in results] == [True, False, False, False, False, True, False, False]
+    assert results[0].coordinates == [[140, 120], [140, 330], [350, 330], [350, 120]]
+    assert metrics.counters[("repeated_frames", ())] == 1
+
+    # The last position is kept through the first misses, and only cleared once the whole frame has been searched
+    assert decoder.misses == 3
+    assert decoder.code_quad == None
+
+def test_metrics():
+    metrics = chromaqr.Metrics()
+    encoder = chromaqr.Encoder(metrics=metrics)
+    decoder = chromaqr.Decoder(metrics=metrics)
+
+    assert decoder.decode(encoder.encode(b"Hello from ChromaQR!")) == b"Hello from ChromaQR!"
+    assert decoder.decode(Image.new("RGB", (100, 100), "white")) == b""
+
+    assert metrics.counters[("decodes", (("result", "success"),))] == 1
+    assert metrics.counters[("channel_failures", (("channel", "red"),))] == 1
+    assert metrics.histograms[("stage_seconds", (("stage", "render"),))][2] == 1
+    assert metrics.histograms[("stage_seconds", (("stage", "zbar"),))][2] == 2
+    assert 'chromaqr_image_pixels_count{operation="decode"} 2' in metrics.render()
+
+def test_draft_decode():
+    encoder = chromaqr.Encoder()
+    decoder = chromaqr.Decoder()
+
+    photo = BytesIO()
+    encoder.encode(b"Hello from ChromaQR!").resize((4000, 4000)).save(photo, "jpeg", quality=90)
+
+    image = Image.open(BytesIO(photo.getvalue()))
+    decoder._load(image)
+    assert image.size == (2000, 2000)
+
+    assert decoder.decode(Image.open(BytesIO(photo.getvalue()))) == b"Hello from ChromaQR!"
+
+def test_strategy_ladder():
+    encoder = chromaqr.Encoder()
+    pixels = np.asarray(encoder.encode(b"Hello from ChromaQR!").convert("RGB")).astype(float)
+
+    # Uneven lighting across the image, with a colour cast
+    pixels = (pixels * np.array([0.7, 0.6, 0.9]) + 40) * np.linspace(0.3, 1.0, pixels.shape[1])[None, :, None]
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    strategy = chromaqr.DecodeStrategy()
+    decoder = chromaqr.Decoder(strategy=strategy)
+
+    assert decoder.decode(image) == b"Hello from ChromaQR!"
+    assert decoder.code_quad == [[40, 40], [40, 250], [250, 250], [250, 40]]
+
+def test_strategy_order():
+    rungs = [chromaqr.Rung(1280, "fixed", "rgb"), chromaqr.Rung(1280, "otsu", "rgb"), chromaqr.Rung(640, "adaptive", "rgb")]
+    strategy = chromaqr.DecodeStrategy(rungs)
+
+    assert strategy.order() == rungs
+    strategy.record(rungs[2])
+    assert strategy.order() == [rungs[2], rungs[0], rungs[1]]
+
+    assert chromaqr.DecodeStrategy(rungs, reorder=False).order() == rungs
+
+def test_ingest_limits():
+    """Test case for spooling a body with a byte limit and checking dimensions from the header."""
+
+    chunks = [bytes(1024)] * 4
+    assert chromaqr.ingest.spool(chunks, max_bytes=4096).read() == bytes(4096)
+    with pytest.raises(chromaqr.ingest.PayloadTooLarge):
+        chromaqr.ingest.spool(chunks, max_bytes=4000)
+
+    image = chromaqr.ingest.open_image("tests/images/generated.png", max_pixels=290 * 290)
+    assert image.size == (290, 290)
+    with pytest.raises(chromaqr.ingest.PayloadTooLarge):
+        chromaqr.ingest.open_image("tests/images/generated.png", max_pixels=1000)
+
+def test_unmix():
+    encoder = chromaqr.Encoder()
+    pixels = np.asarray(encoder.encode(b"Hello from ChromaQR!").convert("RGB")).astype(float) / 255
+
+    # Crosstalk between the channels of a camera, with a colour cast and some noise
+    mixing = np.array([[0.6, 0.3, 0.1], [0.25, 0.55, 0.2], [0.1, 0.35, 0.55]])
+    pixels = (pixels @ mixing.T) * np.array([200, 180, 210]) + np.array([30, 40, 20])
+    pixels += np.random.RandomState(0).normal(0, 6, pixels.shape)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    rgb = chromaqr.Decoder(strategy=chromaqr.DecodeStrategy([chromaqr.Rung(1280, "fixed", "rgb")]))
+    unmix = chromaqr.Decoder(strategy=chromaqr.DecodeStrategy([chromaqr.Rung(1280, "fixed", "unmix")]))
+
+    assert rgb.decode(image.copy()) == b""
+    assert unmix.decode(image.copy()) == b"Hello from ChromaQR!"
+
+def test_encode_options():
+    data = b"Hello from ChromaQR!"
+    image = chromaqr.Encoder().encode(data)
+
+    modules = chromaqr.Encoder().encode_modules(data)
+    assert modules.shape == (29, 29, 3)
+    assert (np.asarray(image)[::10, ::10] == modules).all()
+
+    palette = chromaqr.Encoder(box_size=4, border=2, mode="P").encode(data)
+    assert palette.mode == "P" and palette.size == (100, 100)
+    assert chromaqr.Decoder().decode(palette) == data
+
+    assert chromaqr.encode.parse_compress_level("9") == 9
+    for compress_level in ("10", "-1", "fast", None):
+        with pytest.raises(ValueError, match="valid levels are 0 to 9"):
+            chromaqr.encode.parse_compress_level(compress_level)
+
+def test_capacity_plan():
+    assert chromaqr.max_payload("MED") == 6993
+    assert chromaqr.max_payload("MAX", mode="numeric") == 9171
+
+    # A long numeric run is worth a segment of its own, which needs a smaller version than byte mode thirds
+    data = b"order " + b"0123456789" * 40 + b" shipped"
+    plan = chromaqr.plan(data)
+    assert plan.version < 9
+    assert b"".join(segment.data for segments in plan.parts for segment in segments) == data
+
+    encoder = chromaqr.Encoder()
+    assert chromaqr.Decoder().decode(encoder.encode(data)) == data
+    assert chromaqr.Decoder().decode(encoder.encode(bytes(chromaqr.max_payload("MED")))) == bytes(chromaqr.max_payload("MED"))
@@ -1,7 +1,12 @@
+import chromaqr
 import chromaqr.server
+import chromaqr.cache
 import pytest
 import json
+import zipfile
 from io import BytesIO
+from base64 import b64decode
+from PIL import Image
 
 @pytest.fixture
 def client():
@@ -65,7 +70,7 @@ def test_server_encode_invalid_format(client):
     assert list(response_json.keys()) == ["method", "success", "error"]
     assert response_json["method"] == "encode"
     assert response_json["success"] == False
-    assert response_json["error"] == "unknown format, accepted formats are 'json' and 'image'"
+    assert response_json["error"] == "unknown format, accepted formats are 'json', 'image', 'png' and 'webp'"
 
 def test_server_encode_invalid_error_correction(client):
     """Test case for an erroneous encode with an invalid error correction."""
@@ -81,6 +86,104 @@ def test_server_encode_invalid_error_correction(client):
     assert response_json["success"] == False
     assert response_json["error"] == "invalid error correction value, valid values are LOW, MED, HIGH and MAX"
 
+def test_server_encode_image(client):
+    """Test case for a successful encode returning the image itself."""
+
+    request = {"data": "Hello from ChromaQR!", "format": "image"}
+
+    response = client.post("/encode", data=request, follow_redirects=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.data[:8] == b"\x89PNG\r\n\x1a\n"
+
+def test_server_encode_cache(client):
+    """Test case for repeated encodes being served from the cache."""
+
+    request = {"data": "Cached by ChromaQR!", "format": "image"}
+
+    first = client.post("/encode", data=request, follow_redirects=True)
+    hits = chromaqr.server.encode_cache.hits
+    second = client.post("/encode", data=request, follow_redirects=True)
+
+    assert chromaqr.server.encode_cache.hits == hits + 1
+    assert first.data == second.data
+    assert first.headers["ETag"] == second.headers["ETag"]
+
+def test_server_encode_not_modified(client):
+    """Test case for revalidating an encode with its entity tag."""
+
+    request = {"data": "Hello from ChromaQR!"}
+
+    response = client.post("/encode", data=request, follow_redirects=True)
+    revalidated = client.post("/encode", data=request, headers={"If-None-Match": response.headers["ETag"]}, follow_redirects=True)
+
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+
+def test_server_encode_raw(client):
+    """Test case for encoding binary data sent as the raw request body."""
+
+    data = bytes(range(256))
+
+    response = client.post("/encode?format=png&compressLevel=1", data=data, content_type="application/octet-stream")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert chromaqr.Decoder().decode(Image.open(BytesIO(response.data))) == data
+
+    response = client.post("/encode?format=webp", data=data, content_type="application/octet-stream")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert chromaqr.Decoder().decode(Image.open(BytesIO(response.data))) == data
+
+    response = client.post("/encode?compressLevel=10", data=data, content_type="application/octet-stream")
+
+    assert response.status_code == 400
+    assert json.loads(response.data)["error"] == "invalid compression level, valid levels are 0 to 9"
+
+def test_server_encode_batch(client):
+    """Test case for encoding a batch of payloads into a zip file."""
+
+    lines = [
+        {"data": "Hello from ChromaQR!", "name": "../hello"},
+        {"data": "AAEC", "encoding": "base64"},
+        {"data": "x" * 10000}
+    ]
+    request = "\n".join(json.dumps(line) for line in lines)
+
+    response = client.post("/encode-batch?compressLevel=1", data=request, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/zip"
+
+    with zipfile.ZipFile(BytesIO(response.data)) as archive:
+        assert archive.namelist() == ["hello.png", "1.png", "2.error.txt"]
+        assert chromaqr.Decoder().decode(Image.open(archive.open("hello.png"))) == b"Hello from ChromaQR!"
+        assert chromaqr.Decoder().decode(Image.open(archive.open("1.png"))) == b"\x00\x01\x02"
+
+    request = {"archive": "multipart", "data": [(BytesIO(b"first"), "first"), (BytesIO(b"second"), "second")]}
+    response = client.post("/encode-batch", data=request, content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    assert response.mimetype == "multipart/mixed"
+    assert response.data.count(b"Content-Type: image/png") == 2
+    assert b'filename="second.png"' in response.data
+
+def test_encode_cache_eviction():
+    """Test case for the least recently used image being evicted when the cache is full."""
+
+    cache = chromaqr.cache.EncodeCache(max_bytes=10)
+    cache.put("first", b"12345")
+    cache.put("second", b"12345")
+    cache.get("first")
+    cache.put("third", b"12345")
+
+    assert cache.get("first").data == b"12345"
+    assert cache.get("second") is None
+    assert cache.size == 10
+
 def test_server_decode_success(client):
     """Test case for a successful decode."""
 
@@ -107,6 +210,31 @@ def test_server_decode_success(client):
         [250, 40]
     ]
 
+def test_server_decode_multiple(client):
+    """Test case for decoding every code in an image."""
+
+    encoder = chromaqr.Encoder()
+    sheet = Image.new("RGB", (900, 450), "white")
+    sheet.paste(encoder.encode(b"first"), (0, 0))
+    sheet.paste(encoder.encode(b"second"), (450, 0))
+
+    image = BytesIO()
+    sheet.save(image, "png")
+    image.seek(0)
+
+    response = client.post(
+        "/decode",
+        data={"image": (image, "sheet.png"), "multiple": "true"},
+        follow_redirects=True,
+        content_type="multipart/form-data"
+    )
+    response_json = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert list(response_json.keys()) == ["method", "success", "results"]
+    assert [code["result"] for code in response_json["results"]] == ["first", "second"]
+    assert response_json["results"][1]["coordinates"][0] == [490, 40]
+
 def test_server_decode_url(client):
     """Test case for a successful decode from a URL."""
 
@@ -182,4 +310,72 @@ def test_server_decode_no_code(client):
     assert list(response_json.keys()) == ["method", "success", "error"]
     assert response_json["method"] == "decode"
     assert response_json["success"] == False
-    assert response_json["error"] == "no ChromaQR code was found in the uploaded image"
\ No newline at end of file
+    assert response_json["error"] == "no ChromaQR code was found in the uploaded image"
+
+def test_server_decode_binary(client):
+    """Test case for decoding binary data encoded from a raw request body, which is returned base64-encoded."""
+
+    data = bytes(range(256))
+    image = client.post("/encode?format=png", data=data, content_type="application/octet-stream").data
+
+    for form in ({}, {"multiple": "true"}):
+        response = client.post(
+            "/decode",
+            data=dict(form, image=(BytesIO(image), "binary.png")),
+            follow_redirects=True,
+            content_type="multipart/form-data"
+        )
+        response_json = json.loads(response.data)
+        result = response_json["results"][0] if form else response_json
+
+        assert response.status_code == 200
+        assert result["encoding"] == "base64"
+        assert b64decode(result["result"]) == data
+
+def test_server_decode_too_large(client):
+    """Test case for rejecting a decompression bomb from the dimensions in its header."""
+
+    # 30 million pixels of one colour compress to a few kilobytes
+    output_data = BytesIO()
+    Image.new("1", (6000, 5000), 1).save(output_data, "png")
+    request = {"image": (BytesIO(output_data.getvalue()), "bomb.png")}
+
+    response = client.post(
+        "/decode",
+        data=request,
+        follow_redirects=True,
+        content_type="multipart/form-data"
+    )
+    response_json = json.loads(response.data)
+
+    assert len(output_data.getvalue()) < 100 * 1024
+    assert response.status_code == 413
+    assert response_json["success"] == False
+
+def test_server_metrics(client):
+    """Test case for the Prometheus metrics endpoint."""
+
+    client.post("/encode", data={"data": "Hello from the metrics test!"}, follow_redirects=True)
+    response = client.get("/metrics")
+    text = response.data.decode("utf-8")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert '# TYPE chromaqr_stage_seconds histogram' in text
+    assert 'chromaqr_stage_seconds_bucket{stage="render",le="+Inf"}' in text
+    assert 'chromaqr_encode_cache_misses_total' in text
+
+    # Every sample belongs to a family declared before it, named with one of the suffixes of the family's type
+    suffixes = {"counter": ["_total"], "gauge": [""], "histogram": ["_bucket", "_sum", "_count"]}
+    families = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, family, kind = line.split(" ")
+            assert family not in families
+            families[family] = kind
+        else:
+            name = line.split("{")[0].split(" ")[0]
+            assert any(name == family + suffix for family, kind in families.items() for suffix in suffixes[kind])
+
+    assert families["chromaqr_encode_cache_misses"] == "counter"
+    assert "chromaqr_encode_cache_misses_total" not in families
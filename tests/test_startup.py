@@ -0,0 +1,27 @@
+import chromaqr
+import subprocess
+import sys
+
+HEAVY_MODULES = ["PIL", "numpy", "qrcode", "pyzbar"]
+
+def imported_modules(code: str) -> list:
+    """Run some code in a fresh interpreter and return which of the heavy modules it imported."""
+
+    output = subprocess.check_output([
+        sys.executable, "-c",
+        code + "; import sys; print(' '.join(m for m in {!r} if m in sys.modules))".format(HEAVY_MODULES)
+    ])
+    return output.decode("ascii").split()
+
+def test_startup_imports():
+    """Test case for importing the package and the CLI without loading any heavy dependencies."""
+
+    assert imported_modules("import chromaqr, chromaqr.cli") == []
+
+def test_lazy_exports():
+    """Test case for resolving the public names on first use, loading only the modules they need."""
+
+    assert "pyzbar" not in imported_modules("import chromaqr; chromaqr.Encoder")
+    assert "pyzbar" not in imported_modules("import chromaqr; list(chromaqr.StreamEncoder().encode(bytes(1000)))")
+    assert chromaqr.Encoder is chromaqr.encode.Encoder
+    assert set(chromaqr.__all__) <= set(dir(chromaqr))